@@ -0,0 +1,90 @@
+"""Decode time of per-band vs single-call band reads.
+
+Writes scaled-up synthetic scenes (deflate compressed, pixel and band
+interleaved) to a temporary directory and times reading the five bands with
+one src.read(i) call per band against one src.read(BAND_INDEXES) call. The
+GDAL block cache is kept small, as for scenes larger than the cache, so
+per-band reads of pixel-interleaved images decode every block again.
+
+Usage:
+    python benchmarks/band_reads.py [--size 4096] [--repeat 3]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import rasterio
+from wheat_n_estimation.data_loader import BAND_INDEXES, DataLoader
+
+def write_scene(path, size, interleave):
+    """Write a tiled, compressed five band scene"""
+    rng = np.random.default_rng(0)
+    means = [0.1, 0.2, 0.15, 0.45, 0.3]
+    with rasterio.open(
+        path,
+        'w',
+        driver='GTiff',
+        height=size,
+        width=size,
+        count=len(means),
+        dtype=np.float32,
+        crs='EPSG:32632',
+        transform=rasterio.transform.from_origin(500000, 5300000, 0.1, 0.1),
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        compress='deflate',
+        interleave=interleave
+    ) as dst:
+        for bidx, mean in enumerate(means, start=1):
+            dst.write(rng.normal(mean, 0.02, (size, size)).astype(np.float32), bidx)
+
+def per_band_read(src):
+    return [src.read(bidx) for bidx in BAND_INDEXES]
+
+def single_call_read(src):
+    return src.read(BAND_INDEXES)
+
+def best_time(path, read, repeat):
+    """Best wall time of reading the bands from a freshly opened image"""
+    times = []
+    for _ in range(repeat):
+        with rasterio.open(path) as src:
+            start = time.perf_counter()
+            read(src)
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=4096,
+                        help='Scene width and height in pixels')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per configuration (best time is reported)')
+    parser.add_argument('--cache_mb', type=int, default=16,
+                        help='GDAL block cache size in MB')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            rasterio.Env(GDAL_CACHEMAX=args.cache_mb * 1024 * 1024):
+        print(f"{args.size}x{args.size} px, 5 bands, deflate, "
+              f"{args.cache_mb} MB block cache")
+        for interleave in ('pixel', 'band'):
+            path = Path(tmp_dir) / f"scene_{interleave}.tif"
+            write_scene(path, args.size, interleave)
+
+            per_band = best_time(path, per_band_read, args.repeat)
+            single = best_time(path, single_call_read, args.repeat)
+            with rasterio.open(path) as src:
+                start = time.perf_counter()
+                DataLoader._read_band_means(src)
+                loader = time.perf_counter() - start
+
+            print(f"{interleave:>5} interleave: per-band {per_band:.3f} s, "
+                  f"single call {single:.3f} s ({per_band / single:.1f}x), "
+                  f"loader {loader:.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Shared fixtures for the test suite."""
+
+import pytest
+import numpy as np
+import rasterio
+
+UTM_CRS = '+proj=utm +zone=32 +datum=WGS84 +units=m +no_defs'
+
+# Typical reflectance of the bands (blue, green, red, nir, red_edge)
+BAND_MEANS = [0.1, 0.2, 0.15, 0.45, 0.3]
+
+@pytest.fixture
+def write_image():
+    """
+    Writer of synthetic five-band GeoTIFFs
+
+    The writer takes the output file and optionally the band array
+    (5, height, width). Without bands, normally distributed reflectance
+    around BAND_MEANS is generated in the given shape. block_size writes a
+    tiled image with square blocks (None for strips), scales and offsets
+    are stored per band and further keyword arguments (compress,
+    interleave, nodata, ...) go to the GeoTIFF profile. Returns the
+    written bands.
+    """
+    def write(filename, bands=None, shape=(40, 56), date=None, block_size=16,
+              crs=UTM_CRS, transform=None, scales=None, offsets=None, **profile):
+        if bands is None:
+            bands = np.stack([
+                np.random.normal(mean, 0.02, shape) for mean in BAND_MEANS
+            ]).astype(np.float32)
+        if transform is None:
+            transform = rasterio.transform.from_origin(0, 0, 1, 1)
+        if block_size is not None:
+            profile.update(tiled=True, blockxsize=block_size, blockysize=block_size)
+
+        with rasterio.open(
+            filename,
+            'w',
+            driver='GTiff',
+            height=bands.shape[1],
+            width=bands.shape[2],
+            count=bands.shape[0],
+            dtype=bands.dtype,
+            crs=crs,
+            transform=transform,
+            **profile
+        ) as dst:
+            dst.write(bands)
+            if scales is not None:
+                dst.scales = scales
+            if offsets is not None:
+                dst.offsets = offsets
+            if date is not None:
+                dst.update_tags(date=date)
+        return bands
+
+    return write
@@ -0,0 +1,74 @@
+"""Tests for the batch runner over field directories."""
+
+import pytest
+import pandas as pd
+from datetime import datetime
+from wheat_n_estimation import BatchRunner, JobQueue
+from wheat_n_estimation.batch import field_dirs
+
+@pytest.fixture
+def fields_dir(tmp_path, write_image):
+    """Create two fields with two images each and one field without images"""
+    fields = tmp_path / "fields"
+    for field in ["field_a", "field_b"]:
+        field_dir = fields / field
+        field_dir.mkdir(parents=True)
+        for date in [datetime(2024, 3, 1), datetime(2024, 3, 11)]:
+            write_image(field_dir / f"synthetic_{date.strftime('%Y%m%d')}.tif", shape=(10, 10),
+                        date=date.strftime("%Y-%m-%d"), block_size=None)
+    (fields / "field_empty").mkdir()
+    (fields / "notes.txt").touch()
+    return fields
+
+def test_field_dirs_resolves_globs(fields_dir):
+    """Test glob patterns select directories only"""
+    dirs = field_dirs([str(fields_dir / "*"), fields_dir / "field_a"])
+    assert [d.name for d in dirs] == ["field_a", "field_b", "field_empty"]
+
+def test_batch_runner_consolidates_results(fields_dir, tmp_path):
+    """Test fields run in worker processes with results and failures collected"""
+    output_dir = tmp_path / "batch_output"
+    summary = BatchRunner(output_dir, processes=2).run(str(fields_dir / "*"))
+    
+    results = summary['results']
+    assert sorted(results['field'].unique()) == ["field_a", "field_b"]
+    assert len(results) == 4
+    assert results.columns[0] == 'field'
+    assert results['n_content'].between(1.5, 6.0).all()
+    
+    failures = summary['failures']
+    assert failures['field'].tolist() == ["field_empty"]
+    assert failures['error'].tolist() == ["ValueError"]
+    
+    # Per-field outputs and consolidated tables
+    assert (output_dir / "field_a" / "nitrogen_analysis.csv").exists()
+    assert (output_dir / "field_b" / "technical_report.txt").exists()
+    assert len(pd.read_csv(output_dir / "batch_results.csv")) == 4
+    assert pd.read_csv(output_dir / "batch_failures.csv")['field'].tolist() == ["field_empty"]
+
+def test_batch_runner_rejects_duplicate_field_names(tmp_path):
+    """Test fields with the same name cannot share an output directory"""
+    for farm in ["farm_1", "farm_2"]:
+        (tmp_path / farm / "field_a").mkdir(parents=True)
+    
+    with pytest.raises(ValueError):
+        BatchRunner(tmp_path / "out").run(str(tmp_path / "farm_*" / "field_a"))
+
+def test_batch_runner_queue_resumes(fields_dir, tmp_path):
+    """Test queued fields are processed once and a rerun skips done fields"""
+    output_dir = tmp_path / "batch_output"
+    queue = output_dir / "jobs.sqlite"
+    runner = BatchRunner(output_dir, processes=2)
+    summary = runner.run_queue(queue, str(fields_dir / "*"))
+    
+    assert sorted(summary['results']['field'].unique()) == ["field_a", "field_b"]
+    assert len(summary['results']) == 4
+    assert summary['failures']['field'].tolist() == ["field_empty"]
+    assert summary['failures']['error'].tolist() == ["ValueError"]
+    
+    csv_file = output_dir / "field_a" / "nitrogen_analysis.csv"
+    mtime = csv_file.stat().st_mtime_ns
+    summary = runner.run_queue(queue, str(fields_dir / "*"))
+    assert csv_file.stat().st_mtime_ns == mtime
+    assert len(pd.read_csv(output_dir / "batch_results.csv")) == 4
+    assert JobQueue(queue).counts() == {'pending': 0, 'running': 0, 'done': 2, 'failed': 1}
@@ -0,0 +1,29 @@
+"""Tests for the run manifest."""
+
+import json
+from wheat_n_estimation.checkpoint import RunManifest
+
+def test_stage_completion_depends_on_inputs_and_outputs(tmp_path):
+    """Test stages are redone when inputs change or outputs are missing"""
+    output = tmp_path / "report.txt"
+    output.write_text("report")
+    manifest = RunManifest(tmp_path / "manifest.json", {'stats': 'mean'})
+    manifest.complete("report", {'rows': 2}, [output])
+    
+    reloaded = RunManifest(tmp_path / "manifest.json", {'stats': 'mean'})
+    assert reloaded.completed("report", {'rows': 2})
+    assert not reloaded.completed("report", {'rows': 3})
+    assert reloaded.outputs("report") == [output]
+    
+    output.unlink()
+    assert not reloaded.completed("report", {'rows': 2})
+
+def test_changed_settings_discard_manifest(tmp_path):
+    """Test a manifest written with other settings is not used"""
+    manifest = RunManifest(tmp_path / "manifest.json", {'stats': 'mean', 'shard': (0, 2)})
+    manifest.complete("plots", "table")
+    
+    assert RunManifest(tmp_path / "manifest.json", {'stats': 'mean', 'shard': (0, 2)}).completed("plots", "table")
+    assert not RunManifest(tmp_path / "manifest.json", {'stats': 'overview-2'}).completed("plots", "table")
+    assert not list(tmp_path.glob(".manifest.json.*"))
+    assert json.loads((tmp_path / "manifest.json").read_text())['config']['shard'] == [0, 2]
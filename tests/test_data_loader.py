@@ -7,6 +7,8 @@ from pathlib import Path
 import rasterio
 from datetime import datetime
 from wheat_n_estimation import DataLoader
+from wheat_n_estimation.data_loader import BANDS, is_pixel_interleaved
+from wheat_n_estimation.memmap import MemmapRaster
 
 @pytest.fixture
 def sample_image_dir(tmp_path):
@@ -118,4 +120,543 @@ def test_empty_data_dir(tmp_path):
     
     with pytest.raises(ValueError):
         loader = DataLoader(empty_dir)
-        loader.load_time_series() 
\ No newline at end of file
+        loader.load_time_series() 
+
+@pytest.fixture
+def tiled_image_dir(tmp_path, write_image):
+    """Create a tiled image with several internal blocks"""
+    img_dir = tmp_path / "tiled_images"
+    img_dir.mkdir()
+    
+    rng = np.random.default_rng(42)
+    write_image(img_dir / "synthetic_20240301.tif",
+                rng.normal(0.3, 0.1, (5, 40, 56)).astype(np.float32))
+    return img_dir
+
+def test_streaming_matches_full_read(tiled_image_dir):
+    """Test block-streaming reduction gives the same means as full reads"""
+    full = DataLoader(tiled_image_dir).load_time_series()
+    streamed = DataLoader(tiled_image_dir, streaming=True).load_time_series()
+    
+    assert streamed['date'].equals(full['date'])
+    for band in ['blue', 'green', 'red', 'nir', 'red_edge']:
+        assert np.allclose(streamed[band], full[band], rtol=1e-6)
+
+def test_indices_reuse_loaded_time_series(sample_image_dir, monkeypatch):
+    """Test indices are computed from the last load without re-reading images"""
+    loader = DataLoader(sample_image_dir)
+    loader.load_time_series()
+    
+    def fail(*args, **kwargs):
+        raise AssertionError("images were read twice")
+    monkeypatch.setattr(rasterio, 'open', fail)
+    
+    indices = loader.calculate_vegetation_indices()
+    assert len(indices) == 2
+
+def test_parallel_loading_keeps_date_order(sample_image_dir):
+    """Test thread-pool loading returns the same date-ordered frame"""
+    sequential = DataLoader(sample_image_dir).load_time_series()
+    parallel = DataLoader(sample_image_dir, max_workers=4).load_time_series()
+    
+    assert parallel['date'].is_monotonic_increasing
+    pd.testing.assert_frame_equal(parallel, sequential)
+
+def test_catalog_skips_unchanged_scenes(sample_image_dir, monkeypatch):
+    """Test the scene catalog only decodes new or changed images"""
+    first = DataLoader(sample_image_dir, catalog=True).load_time_series()
+    assert (sample_image_dir / 'scene_catalog.sqlite').exists()
+    
+    decoded = []
+    original = DataLoader._load_scene
+    def tracking_load(self, img_file):
+        decoded.append(img_file.name)
+        return original(self, img_file)
+    monkeypatch.setattr(DataLoader, '_load_scene', tracking_load)
+    
+    cached = DataLoader(sample_image_dir, catalog=True).load_time_series()
+    assert decoded == []
+    pd.testing.assert_frame_equal(cached, first)
+    
+    # Rewrite one scene with new pixel values
+    changed = sample_image_dir / 'synthetic_20240210.tif'
+    with rasterio.open(changed, 'r+') as dst:
+        dst.write(np.full((10, 10), 0.5, dtype=np.float32), 1)
+    
+    reloaded = DataLoader(sample_image_dir, catalog=True).load_time_series()
+    assert decoded == ['synthetic_20240210.tif']
+    assert reloaded['blue'].iloc[1] == pytest.approx(0.5)
+
+def test_catalog_fingerprint_reads_bounded_chunks(tmp_path):
+    """Test large files are fingerprinted from their size, edges and samples"""
+    from wheat_n_estimation.catalog import SceneCatalog
+    
+    img_file = tmp_path / "large.tif"
+    with open(img_file, 'wb') as f:
+        f.truncate(64 * 1024 * 1024)
+    fingerprint = SceneCatalog.fingerprint(img_file)
+    
+    def rewrite(offset, data):
+        with open(img_file, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+    
+    # Bytes between the sampled chunks are not read
+    rewrite(5 * 1024 * 1024, b'\x01')
+    assert SceneCatalog.fingerprint(img_file) == fingerprint
+    
+    for offset in [0, 1024 * 1024, 64 * 1024 * 1024 - 1]:
+        rewrite(offset, b'\x02')
+        assert SceneCatalog.fingerprint(img_file) != fingerprint
+        rewrite(offset, b'\x00')
+    
+    with open(img_file, 'r+b') as f:
+        f.truncate(64 * 1024 * 1024 + 1)
+    assert SceneCatalog.fingerprint(img_file) != fingerprint
+
+def test_indices_frame_matches_records(sample_image_dir):
+    """Test the columnar indices match the per-row compatibility view"""
+    loader = DataLoader(sample_image_dir)
+    time_series = loader.load_time_series()
+    frame = loader.calculate_vegetation_indices_frame()
+    records = loader.calculate_vegetation_indices()
+    
+    assert isinstance(frame, pd.DataFrame)
+    assert list(frame.columns) == ['date', 'NDVI', 'NDRE', 'SAVI', 'GNDVI', 'MCARI', 'CIred-edge']
+    assert len(frame) == len(records) == len(time_series)
+    
+    for (_, row), (_, bands), entry in zip(frame.iterrows(), time_series.iterrows(), records):
+        assert entry['date'] == row['date']
+        assert entry['indices']['NDRE'] == pytest.approx(
+            (bands['nir'] - bands['red_edge']) / (bands['nir'] + bands['red_edge']))
+        assert entry['indices']['MCARI'] == pytest.approx(
+            ((bands['red_edge'] - bands['red']) - 0.2 * (bands['red_edge'] - bands['green']))
+            * (bands['red_edge'] / bands['red']))
+        for name, value in entry['indices'].items():
+            assert row[name] == pytest.approx(value)
+
+@pytest.mark.parametrize('build_overviews', [False, True])
+def test_overview_means_within_error_bound(tiled_image_dir, build_overviews):
+    """Test approximate overview means are close to the full-resolution means"""
+    if build_overviews:
+        with rasterio.open(tiled_image_dir / "synthetic_20240301.tif", 'r+') as dst:
+            dst.build_overviews([2, 4], rasterio.enums.Resampling.average)
+    
+    full = DataLoader(tiled_image_dir).load_time_series()
+    approx = DataLoader(tiled_image_dir, overview_level=2).load_time_series()
+    
+    for band in ['blue', 'green', 'red', 'nir', 'red_edge']:
+        assert approx[f'{band}_se'].iloc[0] > 0
+        assert abs(approx[band].iloc[0] - full[band].iloc[0]) <= 4 * approx[f'{band}_se'].iloc[0]
+
+def test_sampled_means_with_confidence_intervals(tiled_image_dir):
+    """Test block-stratified sampling gives means with confidence intervals"""
+    full = DataLoader(tiled_image_dir).load_time_series()
+    sampled = DataLoader(tiled_image_dir, sample_pixels=1000, random_state=0).load_time_series()
+    again = DataLoader(tiled_image_dir, sample_pixels=1000, random_state=0).load_time_series()
+    pd.testing.assert_frame_equal(sampled, again)
+    
+    for band in ['blue', 'green', 'red', 'nir', 'red_edge']:
+        error = sampled[f'{band}_se'].iloc[0]
+        assert error > 0
+        assert sampled[f'{band}_ci_low'].iloc[0] < sampled[band].iloc[0] < sampled[f'{band}_ci_high'].iloc[0]
+        assert abs(sampled[band].iloc[0] - full[band].iloc[0]) <= 4 * error
+    
+    # Sampling every block is an exact read
+    exhaustive = DataLoader(tiled_image_dir, sample_pixels=10**6).load_time_series()
+    for band in ['blue', 'green', 'red', 'nir', 'red_edge']:
+        assert exhaustive[band].iloc[0] == pytest.approx(full[band].iloc[0], rel=1e-6)
+        assert exhaustive[f'{band}_se'].iloc[0] == 0
+    
+    indices = DataLoader(tiled_image_dir).calculate_vegetation_indices_frame(sampled)
+    assert (indices['NDRE_se'] > 0).all()
+
+def test_stored_stats_fast_path(tiled_image_dir, monkeypatch):
+    """Test written band statistics are reused without reading pixels"""
+    img_file = tiled_image_dir / "synthetic_20240301.tif"
+    full = DataLoader(tiled_image_dir, write_stats=True).load_time_series()
+    assert Path(f"{img_file}.aux.xml").exists()
+    
+    def fail(*args, **kwargs):
+        raise AssertionError("pixels were read")
+    monkeypatch.setattr(DataLoader, '_read_band_means', fail)
+    
+    stored = DataLoader(tiled_image_dir, use_stored_stats=True).load_time_series()
+    pd.testing.assert_frame_equal(stored, full)
+    
+    validated = DataLoader(tiled_image_dir, use_stored_stats=True,
+                           validate_stored_stats=True).load_time_series()
+    pd.testing.assert_frame_equal(validated, full)
+
+def test_invalid_stored_stats_are_ignored(tiled_image_dir):
+    """Test validation falls back to a full read for wrong stored statistics"""
+    img_file = tiled_image_dir / "synthetic_20240301.tif"
+    full = DataLoader(tiled_image_dir).load_time_series()
+    with rasterio.open(img_file, 'r+') as dst:
+        for bidx in range(1, 6):
+            dst.update_tags(bidx, STATISTICS_MEAN='0.9')
+    
+    trusted = DataLoader(tiled_image_dir, use_stored_stats=True).load_time_series()
+    assert trusted['nir'].iloc[0] == pytest.approx(0.9)
+    
+    validated = DataLoader(tiled_image_dir, use_stored_stats=True,
+                           validate_stored_stats=True).load_time_series()
+    pd.testing.assert_frame_equal(validated, full)
+
+def fail_gdal_reduction(monkeypatch):
+    """Make the GDAL fallback of memory-mapped loads fail"""
+    def fail(*args, **kwargs):
+        raise AssertionError("image was not memory mapped")
+    monkeypatch.setattr(DataLoader, '_read_band_means', fail)
+    monkeypatch.setattr(DataLoader, '_stream_band_means', fail)
+
+def test_catalog_keeps_stored_and_exact_means_apart(tiled_image_dir):
+    """Test trusted stored statistics are not served to exact loads"""
+    img_file = tiled_image_dir / "synthetic_20240301.tif"
+    full = DataLoader(tiled_image_dir).load_time_series()
+    with rasterio.open(img_file, 'r+') as dst:
+        for bidx in range(1, 6):
+            dst.update_tags(bidx, STATISTICS_MEAN='0.9')
+    
+    stored = DataLoader(tiled_image_dir, use_stored_stats=True, catalog=True).load_time_series()
+    assert stored['nir'].iloc[0] == pytest.approx(0.9)
+    
+    exact = DataLoader(tiled_image_dir, catalog=True).load_time_series()
+    pd.testing.assert_frame_equal(exact, full)
+    validated = DataLoader(tiled_image_dir, use_stored_stats=True, validate_stored_stats=True,
+                           catalog=True).load_time_series()
+    pd.testing.assert_frame_equal(validated, full)
+
+def test_stored_stats_skipped_with_nodata(tmp_path, write_image):
+    """Test statistics of images with nodata are neither written nor trusted"""
+    img_file = tmp_path / "synthetic_20240301.tif"
+    write_image(img_file, nodata=0)
+    full = DataLoader(tmp_path, write_stats=True).load_time_series()
+    assert not Path(f"{img_file}.aux.xml").exists()
+    
+    # GDAL means exclude nodata pixels, unlike the loader reductions
+    with rasterio.open(img_file, 'r+') as dst:
+        for bidx in range(1, 6):
+            dst.update_tags(bidx, STATISTICS_MEAN='0.9')
+    stored = DataLoader(tmp_path, use_stored_stats=True).load_time_series()
+    pd.testing.assert_frame_equal(stored, full)
+
+def test_memmap_means_match_full_read(tiled_image_dir, monkeypatch):
+    """Test memory-mapped means of an uncompressed image match a full read"""
+    full = DataLoader(tiled_image_dir).load_time_series()
+    fail_gdal_reduction(monkeypatch)
+    mapped = DataLoader(tiled_image_dir, memmap=True).load_time_series()
+    
+    pd.testing.assert_frame_equal(mapped, full, check_exact=False, rtol=1e-6)
+
+@pytest.mark.parametrize('block_size', [None, 16])
+@pytest.mark.parametrize('interleave', ['pixel', 'band'])
+def test_memmap_maps_uncompressed_layouts(tmp_path, block_size, interleave, monkeypatch, write_image):
+    """Test striped and tiled images of either interleaving are memory mapped"""
+    img_file = tmp_path / "synthetic_20240301.tif"
+    bands = write_image(img_file, block_size=block_size, interleave=interleave)
+    with rasterio.open(img_file) as src:
+        mapped = MemmapRaster.open(src)
+        assert mapped is not None
+        np.testing.assert_array_equal(mapped.read([1, 2, 3, 4, 5], rasterio.windows.Window(3, 5, 30, 20)),
+                                      bands[:, 5:25, 3:33])
+        np.testing.assert_allclose(mapped.band_sums([1, 2, 3, 4, 5], rasterio.windows.Window(3, 5, 30, 20)),
+                                   bands[:, 5:25, 3:33].sum(axis=(1, 2), dtype=np.float64), rtol=1e-12)
+    
+    fail_gdal_reduction(monkeypatch)
+    df = DataLoader(tmp_path, memmap=True, write_stats=True).load_time_series()
+    for band, values in zip(BANDS, bands):
+        assert df[band].iloc[0] == pytest.approx(values.mean(dtype=np.float64), rel=1e-9)
+    
+    # Means computed over the memory map are stored for later runs too
+    assert Path(f"{img_file}.aux.xml").exists()
+    stored = DataLoader(tmp_path, use_stored_stats=True).load_time_series()
+    pd.testing.assert_frame_equal(stored, df)
+
+def test_memmap_skips_compressed_images(tmp_path, write_image):
+    """Test compressed images cannot be memory mapped"""
+    filename = tmp_path / "compressed.tif"
+    write_image(filename, np.ones((5, 8, 8), dtype=np.float32), block_size=None, compress='deflate')
+    
+    with rasterio.open(filename) as src:
+        assert MemmapRaster.open(src) is None
+
+@pytest.mark.parametrize('interleave', ['pixel', 'band'])
+def test_full_read_by_interleave(tmp_path, interleave, monkeypatch, write_image):
+    """Test pixel-interleaved images are read in a single call"""
+    bands = write_image(tmp_path / "synthetic_20240301.tif", shape=(32, 32), block_size=None,
+                        compress='deflate', interleave=interleave)
+    with rasterio.open(tmp_path / "synthetic_20240301.tif") as src:
+        assert is_pixel_interleaved(src) == (interleave == 'pixel')
+    
+    reads = []
+    read = rasterio.io.DatasetReader.read
+    def counting_read(self, *args, **kwargs):
+        reads.append(args)
+        return read(self, *args, **kwargs)
+    monkeypatch.setattr(rasterio.io.DatasetReader, 'read', counting_read)
+    
+    df = DataLoader(tmp_path).load_time_series()
+    
+    assert len(reads) == (1 if interleave == 'pixel' else 5)
+    for band, values in zip(BANDS, bands):
+        assert df[band].iloc[0] == pytest.approx(values.mean(), rel=1e-6)
+
+@pytest.fixture
+def scaled_image_dir(tmp_path, write_image):
+    """Create a tiled uint16 image with reflectance scale and offset"""
+    img_dir = tmp_path / "scaled_images"
+    img_dir.mkdir()
+    
+    counts = np.random.randint(0, 65535, (5, 40, 56)).astype(np.uint16)
+    write_image(img_dir / "synthetic_20240301.tif", counts, scales=[1e-5] * 5, offsets=[0.01] * 5)
+    return img_dir, counts
+
+@pytest.mark.parametrize('options', [{}, {'streaming': True}, {'memmap': True}])
+def test_integer_means_scaled_after_reduction(scaled_image_dir, options, monkeypatch):
+    """Test uint16 bands are summed exactly and scaled to reflectance"""
+    img_dir, counts = scaled_image_dir
+    if options.get('memmap'):
+        fail_gdal_reduction(monkeypatch)
+    df = DataLoader(img_dir, **options).load_time_series()
+    
+    for band, values in zip(BANDS, counts):
+        expected = int(values.sum(dtype=np.int64)) / values.size * 1e-5 + 0.01
+        assert df[band].iloc[0] == pytest.approx(expected, rel=1e-12)
+
+def test_iter_scenes_is_lazy_and_date_ordered(tmp_path, monkeypatch, write_image):
+    """Test scenes are sorted by header dates and only read on access"""
+    for name, date in [("b_scene.tif", "2024-03-01"), ("a_scene.tif", "2024-04-01"),
+                       ("c_scene.tif", "2024-02-01")]:
+        write_image(tmp_path / name, np.full((5, 4, 4), 0.3, dtype=np.float32),
+                    date=date, block_size=None)
+    
+    loaded = []
+    load_scene = DataLoader._load_scene
+    def counting_load(self, img_file):
+        loaded.append(Path(img_file).name)
+        return load_scene(self, img_file)
+    monkeypatch.setattr(DataLoader, '_load_scene', counting_load)
+    
+    scenes = list(DataLoader(tmp_path).iter_scenes())
+    assert [scene.path.name for scene in scenes] == ["c_scene.tif", "b_scene.tif", "a_scene.tif"]
+    assert scenes[0].metadata['count'] == 5
+    assert loaded == []
+    
+    assert scenes[1].band_stats['nir'] == pytest.approx(0.3)
+    assert scenes[1].band_stats['date'] == datetime(2024, 3, 1)
+    assert loaded == ["b_scene.tif"]
+
+def test_iter_scenes_uses_catalog(sample_image_dir, monkeypatch):
+    """Test cataloged scenes are served without opening the images"""
+    DataLoader(sample_image_dir, catalog=True).load_time_series()
+    monkeypatch.setattr(rasterio, 'open', lambda *args, **kwargs: pytest.fail("image opened"))
+    
+    scenes = list(DataLoader(sample_image_dir, catalog=True).iter_scenes())
+    assert [scene.band_stats['date'] for scene in scenes] == [datetime(2024, 2, 1), datetime(2024, 2, 10)]
+
+def test_scene_caches_reads(tiled_image_dir, monkeypatch):
+    """Test a scene reads its header and every band at most once"""
+    from wheat_n_estimation import Scene
+    from rasterio.windows import Window
+    
+    img_file = next(tiled_image_dir.glob('*.tif'))
+    loader = DataLoader(tiled_image_dir)
+    expected = loader.load_time_series().iloc[0]
+    
+    reads = []
+    read = rasterio.io.DatasetReader.read
+    def counting_read(self, *args, **kwargs):
+        reads.append(args)
+        return read(self, *args, **kwargs)
+    monkeypatch.setattr(rasterio.io.DatasetReader, 'read', counting_read)
+    
+    with Scene(img_file, loader) as scene:
+        assert not hasattr(scene, '__dict__')
+        assert scene.metadata['width'] == 56
+        assert scene._dataset is None
+        
+        window = scene.read(Window(16, 0, 16, 16))
+        assert window.shape == (5, 16, 16)
+        assert scene.read(Window(16, 0, 16, 16)) is window
+        
+        nir = scene.band('nir')
+        bands = scene.bands
+        assert bands['nir'] is nir and list(bands) == list(BANDS)
+        for band in BANDS:
+            assert scene.band_means[band] == pytest.approx(expected[band], rel=1e-6)
+        assert scene.band_stats['date'] == expected['date']
+        np.testing.assert_array_equal(scene.read(Window(0, 16, 8, 8)), np.stack(
+            [bands[band][16:24, :8] for band in BANDS]))
+    
+    # One window, the NIR band and the four remaining bands
+    assert len(reads) == 3
+    assert scene._dataset is None
+
+@pytest.mark.parametrize('options', [
+    {'overview_level': 2},
+    {'sample_pixels': 1000, 'random_state': 0},
+    {'streaming': True, 'bounds': (10, -30, 40, -5)},
+    {'bounds': (10, -30, 40, -5)}
+])
+def test_scene_band_means_follow_loader_reduction(tiled_image_dir, options):
+    """Test lazy band means use the loader's reduction and clip window"""
+    from wheat_n_estimation import Scene
+    
+    img_file = next(tiled_image_dir.glob('*.tif'))
+    loader = DataLoader(tiled_image_dir, **options)
+    expected = loader.load_time_series().iloc[0]
+    
+    with Scene(img_file, loader) as scene:
+        scene.band('nir')
+        for band in BANDS:
+            assert scene.band_means[band] == expected[band]
+        scene.bands
+        assert scene.band_stats['nir'] == expected['nir']
+
+def test_date_range_skips_other_scenes(sample_image_dir, monkeypatch):
+    """Test scenes outside the date range are never decoded"""
+    loaded = []
+    load_scene = DataLoader._load_scene
+    def counting_load(self, img_file):
+        loaded.append(Path(img_file).name)
+        return load_scene(self, img_file)
+    monkeypatch.setattr(DataLoader, '_load_scene', counting_load)
+    
+    df = DataLoader(sample_image_dir, start_date='2024-02-05', end_date='2024-02-10').load_time_series()
+    
+    assert df['date'].tolist() == [pd.Timestamp(2024, 2, 10)]
+    assert loaded == ["synthetic_20240210.tif"]
+    with pytest.raises(ValueError):
+        DataLoader(sample_image_dir, end_date='2024-01-31').load_time_series()
+
+@pytest.mark.parametrize('options', [{}, {'streaming': True}, {'memmap': True}])
+def test_bounds_clip_band_means(tiled_image_dir, options, monkeypatch):
+    """Test band means only cover the pixels within the bounds"""
+    img_file = next(tiled_image_dir.glob('*.tif'))
+    with rasterio.open(img_file) as src:
+        data = src.read()
+    if options.get('memmap'):
+        fail_gdal_reduction(monkeypatch)
+        # Clipped tiled images are reduced over tile views, not copied
+        monkeypatch.setattr(MemmapRaster, 'read', lambda *args: pytest.fail("window copied"))
+    
+    # Pixel columns 10-39 and rows 5-29 (origin at 0, 0 with 1 m pixels)
+    df = DataLoader(tiled_image_dir, bounds=(10, -30, 40, -5), **options).load_time_series()
+    for band, values in zip(BANDS, data):
+        assert df[band].iloc[0] == pytest.approx(values[5:30, 10:40].mean(dtype=np.float64), rel=1e-9)
+    
+    with pytest.raises(ValueError):
+        DataLoader(tiled_image_dir, bounds=(100, -30, 140, -5), **options).load_time_series()
+
+def test_bounds_in_other_crs(tiled_image_dir):
+    """Test bounds are transformed to the image CRS"""
+    loader = DataLoader(tiled_image_dir, bounds=(10, -30, 40, -5))
+    expected = loader.load_time_series()
+    
+    utm = rasterio.crs.CRS.from_string('+proj=utm +zone=32 +datum=WGS84 +units=m +no_defs')
+    bounds = rasterio.warp.transform_bounds(utm, 'EPSG:4326', 10.2, -29.8, 39.8, -5.2)
+    df = DataLoader(tiled_image_dir, bounds=bounds, bounds_crs='EPSG:4326').load_time_series()
+    pd.testing.assert_frame_equal(df, expected)
+
+def test_prefetch_reads_ahead_with_bounded_depth(tmp_path, monkeypatch, write_image):
+    """Test the read-ahead thread stays within depth scenes of the consumer"""
+    import threading
+    from wheat_n_estimation import data_loader
+    
+    for day in range(1, 7):
+        write_image(tmp_path / f"synthetic_202403{day:02d}.tif",
+                    np.full((5, 4, 4), 0.1 * day, dtype=np.float32), block_size=None)
+    
+    consumed = []
+    lead = []
+    read_ahead = data_loader.read_ahead
+    def recording_read_ahead(img_file, stop=None):
+        # Scenes read so far (including this one) minus scenes consumed
+        lead.append(len(lead) + 1 - len(consumed))
+        read_ahead(img_file, stop)
+    monkeypatch.setattr(data_loader, 'read_ahead', recording_read_ahead)
+    
+    loader = DataLoader(tmp_path, prefetch=2)
+    for scene in loader.iter_scenes():
+        consumed.append(scene.date.strftime('%Y%m%d'))
+        assert scene.band_stats['nir'] == pytest.approx(0.1 * int(consumed[-1][-2:]))
+    
+    assert len(consumed) == 6 and len(lead) == 6
+    # Up to two queued scenes, one being read and one taken but not yet recorded
+    assert all(0 < ahead <= 2 + 2 for ahead in lead)
+    
+    # Stopping early shuts the thread down
+    scenes = loader.iter_scenes()
+    next(scenes)
+    scenes.close()
+    assert not any(thread.name == 'scene-read-ahead' for thread in threading.enumerate())
+    
+    pd.testing.assert_frame_equal(loader.load_time_series(), DataLoader(tmp_path).load_time_series())
+
+def test_shards_partition_scenes(tiled_image_dir):
+    """Test the shards of a directory are disjoint and cover every scene"""
+    all_scenes = [scene.path for scene in DataLoader(tiled_image_dir).iter_scenes()]
+    sharded = [
+        [scene.path for scene in DataLoader(tiled_image_dir, shard=(index, 2)).iter_scenes()]
+        for index in range(2)
+    ]
+    
+    assert sorted(sharded[0] + sharded[1]) == sorted(all_scenes)
+    assert not set(sharded[0]) & set(sharded[1])
+    
+    with pytest.raises(ValueError):
+        DataLoader(tiled_image_dir, shard=(2, 2))
+
+def test_sampled_records_carry_index_errors(tiled_image_dir):
+    """Test scalar predictions on sampled loads report the sampling error"""
+    from wheat_n_estimation import NitrogenEstimator
+    loader = DataLoader(tiled_image_dir, sample_pixels=1000, random_state=0)
+    records = loader.calculate_vegetation_indices()
+    assert records[0]['indices']['NDRE_se'] > 0
+    
+    estimator = NitrogenEstimator()
+    uncertainty = estimator.predict(records)[0]['uncertainty']
+    batch = estimator.predict_batch(loader.calculate_vegetation_indices_frame(loader.time_series))
+    assert uncertainty['sampling_error'] == pytest.approx(batch['sampling_error'].iloc[0])
+    assert uncertainty['total_error'] == pytest.approx(batch['total_error'].iloc[0])
+
+def test_single_sampled_block_has_unknown_error(tiled_image_dir):
+    """Test a sample within one block reports unknown, not zero, sampling error"""
+    from wheat_n_estimation import NitrogenEstimator
+    loader = DataLoader(tiled_image_dir, sample_pixels=100, random_state=0)
+    sampled = loader.load_time_series()
+    assert np.isnan(sampled['nir_se'].iloc[0])
+    
+    indices = loader.calculate_vegetation_indices_frame()
+    assert np.isnan(indices['NDRE_se'].iloc[0])
+    
+    estimator = NitrogenEstimator()
+    batch = estimator.predict_batch(indices)
+    uncertainty = estimator.predict(loader.calculate_vegetation_indices())[0]['uncertainty']
+    for column in ('sampling_error', 'total_error'):
+        assert np.isnan(batch[column].iloc[0])
+        assert np.isnan(uncertainty[column])
+    assert np.isfinite(batch['n_content'].iloc[0])
+
+@pytest.mark.parametrize('options', [
+    {'use_stored_stats': True},
+    {'overview_level': 2},
+    {'sample_pixels': 1000, 'random_state': 0},
+    {'bounds': (10, -30, 40, -5)}
+])
+def test_prefetch_skips_partial_read_modes(tiled_image_dir, options, monkeypatch):
+    """Test prefetch does not read whole files when only part of them is needed"""
+    from wheat_n_estimation import data_loader
+    
+    read = []
+    monkeypatch.setattr(data_loader, 'read_ahead', lambda img_file, stop=None: read.append(img_file))
+    
+    loader = DataLoader(tiled_image_dir, prefetch=2, **options)
+    assert len([scene.band_stats for scene in loader.iter_scenes()]) == 1
+    loader.load_time_series()
+    assert read == []
+    
+    # Whole-image reductions still read ahead
+    list(DataLoader(tiled_image_dir, prefetch=2).iter_scenes())
+    assert len(read) == 1
@@ -0,0 +1,127 @@
+"""Tests for the shared job queue."""
+
+import sqlite3
+import threading
+import time
+import pytest
+from wheat_n_estimation import JobQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    """Create a queue with three jobs and a short lease"""
+    job_queue = JobQueue(tmp_path / "jobs.sqlite", lease_seconds=0.2, max_attempts=2)
+    job_queue.add({name: {'data_dir': f"/fields/{name}"} for name in ["a", "b", "c"]})
+    return job_queue
+
+def test_claim_complete_and_fail(queue):
+    """Test jobs are handed out once and their outcomes recorded"""
+    first = queue.claim("worker-1")
+    second = queue.claim("worker-2")
+    assert (first['name'], second['name']) == ("a", "b")
+    assert first['payload'] == {'data_dir': "/fields/a"}
+    assert first['attempts'] == 1
+    
+    queue.complete("a", "worker-1")
+    queue.fail("b", "worker-2", "ValueError: no images")
+    
+    assert queue.counts() == {'pending': 1, 'running': 0, 'done': 1, 'failed': 1}
+    assert queue.jobs("failed")[0]['error'] == "ValueError: no images"
+
+def test_concurrent_claims_are_exclusive(tmp_path):
+    """Test workers with their own connections never claim the same job"""
+    path = tmp_path / "jobs.sqlite"
+    JobQueue(path).add({f"field_{i:02d}": {} for i in range(40)})
+    claimed = []
+    
+    def work(worker):
+        job_queue = JobQueue(path)
+        while (job := job_queue.claim(worker)) is not None:
+            claimed.append(job['name'])
+            job_queue.complete(job['name'], worker)
+    
+    threads = [threading.Thread(target=work, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert sorted(claimed) == [f"field_{i:02d}" for i in range(40)]
+
+def test_expired_lease_is_reclaimed(queue):
+    """Test the job of a worker that stopped renewing goes to another worker"""
+    assert queue.claim("crashed")['name'] == "a"
+    queue.claim("worker")
+    queue.claim("worker")
+    assert queue.claim("worker") is None
+    assert queue.next_expiry() is not None
+    
+    time.sleep(0.3)
+    job = queue.claim("worker")
+    assert job['name'] == "a"
+    assert job['attempts'] == 2
+    
+    # The crashed worker no longer owns the job
+    assert not queue.renew("a", "crashed")
+    queue.complete("a", "crashed")
+    assert queue.jobs()[0]['status'] == "running"
+
+def test_repeatedly_expired_job_fails(queue):
+    """Test a job whose workers keep dying is failed after max_attempts"""
+    queue.add({"d": {}})
+    for _ in range(2):
+        while queue.claim("crashed") is not None:
+            pass
+        time.sleep(0.3)
+    
+    assert queue.claim("worker") is None
+    assert queue.counts()['failed'] == 4
+    assert queue.jobs()[0]['error'].startswith("LeaseExpired")
+    
+    assert queue.retry_failed() == 4
+    assert queue.claim("worker")['attempts'] == 1
+
+def test_heartbeat_keeps_lease(queue):
+    """Test a running job is not reclaimed while its worker renews the lease"""
+    job = queue.claim("worker-1")
+    with queue.heartbeat(job['name'], "worker-1"):
+        time.sleep(0.5)
+        claimed = [queue.claim("worker-2")['name'] for _ in range(2)]
+    assert claimed == ["b", "c"]
+
+def test_heartbeat_survives_renewal_errors(queue, monkeypatch):
+    """Test a failed renewal (e.g. a locked database) is retried"""
+    renew = JobQueue.renew
+    calls = []
+    def flaky_renew(self, name, worker):
+        calls.append(name)
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        return renew(self, name, worker)
+    monkeypatch.setattr(JobQueue, 'renew', flaky_renew)
+    
+    job = queue.claim("worker-1")
+    with queue.heartbeat(job['name'], "worker-1"):
+        time.sleep(0.5)
+        assert len(calls) > 3
+        assert queue.claim("worker-2")['name'] == "b"
+
+def test_reads_do_not_take_the_write_lock(queue):
+    """Test status queries proceed while another connection holds the write lock"""
+    conn = sqlite3.connect(queue.path, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.monotonic()
+        assert queue.counts()['pending'] == 3
+        assert len(queue.jobs()) == 3
+        assert queue.next_expiry() is None
+        assert time.monotonic() - start < 5
+    finally:
+        conn.execute("ROLLBACK")
+        conn.close()
+
+def test_add_keeps_existing_state(queue):
+    """Test re-adding jobs on resume does not redo completed ones"""
+    queue.complete(queue.claim("worker")['name'], "worker")
+    
+    assert queue.add({name: {} for name in ["a", "b", "c", "d"]}) == 1
+    assert queue.counts() == {'pending': 3, 'running': 0, 'done': 1, 'failed': 0}
@@ -108,4 +108,119 @@ def test_invalid_indices():
         estimator.estimate_n_content_from_indices({})
     
     with pytest.raises(ValueError):
-        estimator.estimate_n_content_from_indices({'NDVI': -1.0})  # Invalid NDVI 
\ No newline at end of file
+        estimator.estimate_n_content_from_indices({'NDVI': -1.0})  # Invalid NDVI 
+
+def test_predict_batch_matches_scalar(time_series_indices):
+    """Test batch prediction matches the per-date estimator"""
+    estimator = NitrogenEstimator()
+    frame = pd.DataFrame([{'date': ts['date'], **ts['indices']} for ts in time_series_indices])
+    batch = estimator.predict_batch(frame)
+    
+    assert len(batch) == len(time_series_indices)
+    assert batch['valid'].all()
+    
+    for (_, row), ts in zip(batch.iterrows(), time_series_indices):
+        expected = estimator.estimate_n_content_from_indices(ts['indices'])
+        assert row['date'] == ts['date']
+        assert row['n_content'] == pytest.approx(expected['n_content'])
+        assert row['rmse'] == pytest.approx(expected['uncertainty']['rmse'])
+        assert row['r2_mean'] == pytest.approx(expected['uncertainty']['r2_mean'])
+        assert row['estimation_quality'] == estimator.get_estimation_quality(expected['uncertainty'])
+        for method, weight in expected['method_weights'].items():
+            assert row[f'{method}_weight'] == pytest.approx(weight)
+
+def test_predict_batch_masks_missing_indices():
+    """Test missing indices are masked instead of raising"""
+    estimator = NitrogenEstimator()
+    batch = estimator.predict_batch({
+        'NDRE': np.array([0.5, np.nan, np.nan]),
+        'MCARI': np.array([0.3, 0.3, np.nan]),
+        'SAVI': np.array([0.6, 0.6, 0.6])
+    })
+    
+    assert batch['valid'].tolist() == [True, True, False]
+    assert batch['sample_size'].tolist() == [2, 1, 0]
+    assert np.isnan(batch['n_content'].iloc[2])
+    
+    expected = estimator.estimate_n_content_from_indices({'MCARI': 0.3, 'SAVI': 0.6})
+    assert batch['n_content'].iloc[1] == pytest.approx(expected['n_content'])
+    assert batch['MCARI_weight'].iloc[1] == pytest.approx(1.0)
+    assert np.isnan(batch['NDRE_weight'].iloc[1])
+    
+    predictions = estimator.batch_to_predictions(batch)
+    assert len(predictions) == 2
+    assert set(predictions[1]['confidence_intervals']) == {'MCARI'}
+
+@pytest.mark.parametrize('use_numexpr', [False, True])
+def test_fused_pixel_estimate_matches_ensemble(use_numexpr):
+    """Test the fused kernel matches the separate index and ensemble steps"""
+    if use_numexpr:
+        pytest.importorskip('numexpr')
+    from wheat_n_estimation.data_loader import compute_vegetation_indices
+    from wheat_n_estimation.n_estimator import fused_pixel_estimate
+    
+    rng = np.random.default_rng(42)
+    bands = {name: rng.uniform(0.0, 0.6, (64, 64))
+             for name in ['blue', 'green', 'red', 'nir', 'red_edge']}
+    bands['red'][0, :4] = 0.0
+    bands['red_edge'][1, :4] = 0.0
+    bands['nir'][2, :4] = np.nan
+    
+    indices = compute_vegetation_indices(bands)
+    expected = NitrogenEstimator().estimate_n_content_arrays(indices)
+    fused = fused_pixel_estimate(**bands, include_indices=True, use_numexpr=use_numexpr)
+    
+    for name in ['n_content', 'rmse']:
+        np.testing.assert_allclose(fused[name], expected[name], rtol=1e-12)
+    for name, values in indices.items():
+        np.testing.assert_allclose(fused[name], values, rtol=1e-12)
+
+@pytest.mark.parametrize('use_numexpr', [False, True])
+def test_float32_deviation_from_float64(use_numexpr):
+    """Test float32 pixel estimates stay close to the float64 results"""
+    if use_numexpr:
+        pytest.importorskip('numexpr')
+    from wheat_n_estimation.data_loader import compute_vegetation_indices
+    from wheat_n_estimation.n_estimator import fused_pixel_estimate
+    
+    rng = np.random.default_rng(7)
+    bands = {name: rng.uniform(0.02, 0.6, (64, 64)).astype(np.float32)
+             for name in ['blue', 'green', 'red', 'nir', 'red_edge']}
+    bands['red'][0, :4] = 0.0
+    bands['nir'][2, :4] = np.nan
+    
+    double = fused_pixel_estimate(**bands, include_indices=True, use_numexpr=use_numexpr)
+    single = fused_pixel_estimate(**bands, include_indices=True, use_numexpr=use_numexpr,
+                                  dtype='float32')
+    for name, values in double.items():
+        assert single[name].dtype == np.float32
+        np.testing.assert_allclose(single[name], values, rtol=1e-5, atol=1e-5)
+    
+    # Separate index and ensemble steps in float32
+    indices = compute_vegetation_indices(bands, dtype=np.float32)
+    arrays = NitrogenEstimator().estimate_n_content_arrays(indices, dtype=np.float32)
+    assert arrays['r2_mean'].dtype == np.float32
+    for name in ['n_content', 'rmse']:
+        assert arrays[name].dtype == np.float32
+        np.testing.assert_allclose(arrays[name], double[name], rtol=1e-5, atol=1e-5)
+
+def test_unsupported_compute_dtype():
+    """Test only float32 and float64 are accepted as compute precision"""
+    from wheat_n_estimation.n_estimator import fused_pixel_estimate
+    
+    with pytest.raises(ValueError):
+        fused_pixel_estimate(*np.ones((5, 2, 2)), dtype=np.float16)
+
+def test_sampling_error_in_uncertainty(sample_indices):
+    """Test index standard errors are reported in the uncertainty output"""
+    estimator = NitrogenEstimator()
+    indices = {**sample_indices, 'NDRE_se': 0.01, 'CIred-edge_se': 0.05, 'MCARI_se': 0.02}
+    
+    result = estimator.estimate_n_content_from_indices(indices)
+    uncertainty = result['uncertainty']
+    assert uncertainty['sampling_error'] > 0
+    assert uncertainty['total_error'] > uncertainty['rmse']
+    
+    batch = estimator.predict_batch({name: np.array([value]) for name, value in indices.items()})
+    assert batch['sampling_error'].iloc[0] == pytest.approx(uncertainty['sampling_error'])
+    assert batch['total_error'].iloc[0] == pytest.approx(uncertainty['total_error'])
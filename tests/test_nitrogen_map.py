@@ -0,0 +1,129 @@
+"""Tests for the per-pixel nitrogen maps."""
+
+import pytest
+import numpy as np
+import rasterio
+import shutil
+from wheat_n_estimation import DataLoader, NitrogenEstimator, NitrogenMapper
+
+@pytest.fixture
+def sample_image(tmp_path, write_image):
+    """Create a tiled multispectral image"""
+    filename = tmp_path / "synthetic_20240301.tif"
+    write_image(filename, date="2024-03-01", crs='EPSG:32632',
+                transform=rasterio.transform.from_origin(500000, 5300000, 0.1, 0.1))
+    return filename
+
+def test_write_map_preserves_georeferencing(sample_image, tmp_path):
+    """Test the N map keeps the CRS, transform and shape of its source"""
+    output_file = tmp_path / "n_map.tif"
+    NitrogenMapper().write_map(sample_image, output_file)
+    
+    with rasterio.open(sample_image) as src, rasterio.open(output_file) as dst:
+        assert dst.crs == src.crs
+        assert dst.transform == src.transform
+        assert (dst.height, dst.width) == (src.height, src.width)
+        assert dst.count == 2
+        assert dst.descriptions == ('n_content', 'rmse')
+        assert dst.tags()['date'] == "2024-03-01"
+
+def test_map_pixels_match_scalar_estimator(sample_image, tmp_path):
+    """Test every pixel uses the same ensemble as the scalar estimator"""
+    output_file = tmp_path / "n_map.tif"
+    NitrogenMapper().write_map(sample_image, output_file)
+    
+    with rasterio.open(sample_image) as src, rasterio.open(output_file) as dst:
+        bands = src.read().astype(np.float64)
+        n_map = dst.read(1)
+    
+    estimator = NitrogenEstimator()
+    for row, col in [(0, 0), (17, 33), (39, 55)]:
+        blue, green, red, nir, red_edge = bands[:, row, col]
+        indices = {
+            'NDRE': (nir - red_edge) / (nir + red_edge),
+            'SAVI': 1.5 * (nir - red) / (nir + red + 0.5),
+            'MCARI': ((red_edge - red) - 0.2 * (red_edge - green)) * (red_edge / red),
+            'CIred-edge': (nir / red_edge) - 1
+        }
+        expected = estimator.estimate_n_content_from_indices(indices)
+        assert n_map[row, col] == pytest.approx(expected['n_content'], rel=1e-5)
+
+def test_write_maps_names_by_source_file(sample_image, tmp_path):
+    """Test one map is written per image, also for images of the same day"""
+    second_image = sample_image.with_name("synthetic_20240301_b.tif")
+    shutil.copy(sample_image, second_image)
+    map_files = NitrogenMapper().write_maps([sample_image, second_image], tmp_path / "maps")
+    
+    assert [f.name for f in map_files] == [
+        "n_content_synthetic_20240301.tif", "n_content_synthetic_20240301_b.tif"]
+    assert all(f.exists() for f in map_files)
+    with rasterio.open(map_files[1]) as dst:
+        assert dst.tags()['date'] == "2024-03-01"
+    
+    with pytest.raises(ValueError):
+        NitrogenMapper().write_maps([sample_image, sample_image], tmp_path / "maps")
+
+def test_memmap_map_matches_gdal_read(sample_image, tmp_path, monkeypatch):
+    """Test memory-mapped reads give the same map as GDAL block reads"""
+    NitrogenMapper().write_map(sample_image, tmp_path / "gdal.tif")
+    
+    def fail(*args, **kwargs):
+        raise AssertionError("image was not memory mapped")
+    with monkeypatch.context() as patch:
+        patch.setattr(rasterio.io.DatasetReader, 'read', fail)
+        NitrogenMapper(memmap=True).write_map(sample_image, tmp_path / "mapped.tif")
+    
+    with rasterio.open(tmp_path / "gdal.tif") as a, rasterio.open(tmp_path / "mapped.tif") as b:
+        np.testing.assert_array_equal(a.read(), b.read())
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_map_clipped_to_bounds(sample_image, tmp_path, memmap, monkeypatch):
+    """Test bounds maps only read the intersecting blocks and cover the window"""
+    NitrogenMapper().write_map(sample_image, tmp_path / "full.tif")
+    
+    reads = []
+    read = rasterio.io.DatasetReader.read
+    def counting_read(self, *args, **kwargs):
+        reads.append(kwargs.get('window'))
+        return read(self, *args, **kwargs)
+    monkeypatch.setattr(rasterio.io.DatasetReader, 'read', counting_read)
+    
+    # Pixel columns 10-39 and rows 5-29 of the 0.1 m grid
+    loader = DataLoader(sample_image.parent, bounds=(500001, 5299997, 500004, 5299999.5))
+    NitrogenMapper(memmap=memmap).write_map(sample_image, tmp_path / "clipped.tif", loader.clip_window)
+    monkeypatch.undo()
+    
+    # Six of the twelve 16-pixel blocks intersect the window
+    assert len(reads) == (0 if memmap else 6)
+    with rasterio.open(tmp_path / "full.tif") as full, rasterio.open(tmp_path / "clipped.tif") as dst:
+        assert (dst.height, dst.width) == (25, 30)
+        assert dst.transform == rasterio.transform.from_origin(500001, 5299999.5, 0.1, 0.1)
+        np.testing.assert_array_equal(dst.read(), full.read()[:, 5:30, 10:40])
+
+def test_map_applies_band_scaling(tmp_path, write_image):
+    """Test scaled integer images give the same map as float reflectance"""
+    reflectance = np.stack([
+        np.random.normal(mean, 0.02, (16, 16)) for mean in [0.1, 0.2, 0.15, 0.45, 0.3]
+    ])
+    counts = np.round(reflectance * 10000).astype(np.uint16)
+    write_image(tmp_path / "scaled_20240301.tif", counts, block_size=None, scales=[1e-4] * 5)
+    write_image(tmp_path / "float_20240301.tif", counts * 1e-4, block_size=None)
+    
+    mapper = NitrogenMapper()
+    mapper.write_map(tmp_path / "scaled_20240301.tif", tmp_path / "scaled_map.tif")
+    mapper.write_map(tmp_path / "float_20240301.tif", tmp_path / "float_map.tif")
+    
+    with rasterio.open(tmp_path / "scaled_map.tif") as a, rasterio.open(tmp_path / "float_map.tif") as b:
+        np.testing.assert_allclose(a.read(), b.read(), rtol=1e-6)
+
+@pytest.mark.parametrize('fused', [True, False])
+def test_float32_map_close_to_float64(sample_image, tmp_path, fused):
+    """Test the default float32 maps deviate negligibly from float64 maps"""
+    NitrogenMapper(fused=fused).write_map(sample_image, tmp_path / "single.tif")
+    NitrogenMapper(fused=fused, dtype=np.float64).write_map(sample_image, tmp_path / "double.tif")
+    
+    with rasterio.open(tmp_path / "single.tif") as a, rasterio.open(tmp_path / "double.tif") as b:
+        assert a.dtypes == ('float32', 'float32')
+        assert b.dtypes == ('float64', 'float64')
+        # Well below the 0.31-0.39 % RMSE of the regressions
+        np.testing.assert_allclose(a.read(), b.read(), rtol=1e-5, atol=1e-5)
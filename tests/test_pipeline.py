@@ -5,6 +5,7 @@ import numpy as np
 import pandas as pd
 from pathlib import Path
 import shutil
+import json
 from datetime import datetime
 import rasterio
 from wheat_n_estimation import NitrogenEstimationPipeline
@@ -127,4 +128,151 @@ def test_pipeline_results_consistency(sample_data_dir, output_dir):
     # Check if CSV results match pipeline results
     for i, result in enumerate(results):
         assert abs(df.iloc[i]['n_content'] - result['n_content']) < 1e-6
-        assert abs(df.iloc[i]['rmse'] - result['uncertainty']['rmse']) < 1e-6 
\ No newline at end of file
+        assert abs(df.iloc[i]['rmse'] - result['uncertainty']['rmse']) < 1e-6 
+
+def test_pipeline_streams_results(sample_data_dir, output_dir, monkeypatch):
+    """Test each estimate is written before the next scene is loaded"""
+    from wheat_n_estimation.data_loader import DataLoader
+    
+    written_rows = []
+    scene_record = DataLoader._scene_record
+    def recording_scene_record(self, img_file):
+        csv_file = output_dir / 'nitrogen_analysis.csv'
+        written_rows.append(len(pd.read_csv(csv_file)) if csv_file.exists() else 0)
+        return scene_record(self, img_file)
+    monkeypatch.setattr(DataLoader, '_scene_record', recording_scene_record)
+    
+    pipeline = NitrogenEstimationPipeline(sample_data_dir, output_dir)
+    pipeline.run_pipeline()
+    
+    assert written_rows == [0, 1]
+    assert len(pd.read_csv(output_dir / 'nitrogen_analysis.csv')) == 2
+
+def test_sharded_runs_merge_to_full_results(sample_data_dir, output_dir, tmp_path):
+    """Test merged shard outputs match an unsharded run"""
+    full = NitrogenEstimationPipeline(sample_data_dir, tmp_path / "full")
+    full.run_pipeline()
+    
+    # Two scenes over three shards leaves one shard empty
+    for index in range(3):
+        predictions = NitrogenEstimationPipeline(
+            sample_data_dir, output_dir, shard=(index, 3)).run_pipeline()
+        assert len(predictions) <= 1
+    assert not (output_dir / "nitrogen_analysis.csv").exists()
+    assert len(list((output_dir / "shards").glob("shard_*_of_0003.csv"))) == 3
+    
+    merged = NitrogenEstimationPipeline(None, output_dir)
+    predictions = merged.merge_shards()
+    
+    assert [p['date'] for p in predictions] == sorted(p['date'] for p in predictions)
+    pd.testing.assert_frame_equal(
+        pd.read_csv(output_dir / "nitrogen_analysis.csv"),
+        pd.read_csv(tmp_path / "full" / "nitrogen_analysis.csv")
+    )
+    assert (output_dir / "technical_report.txt").exists()
+
+def test_merge_requires_all_shards(sample_data_dir, output_dir):
+    """Test merging fails while shard outputs are missing"""
+    NitrogenEstimationPipeline(sample_data_dir, output_dir, shard=(1, 2)).run_pipeline()
+    
+    with pytest.raises(ValueError, match="Missing outputs of shards 0 of 2"):
+        NitrogenEstimationPipeline(None, output_dir).merge_shards()
+
+def test_checkpoint_resumes_interrupted_run(sample_data_dir, output_dir, monkeypatch):
+    """Test a re-run only processes scenes and stages that are missing"""
+    from wheat_n_estimation.data_loader import DataLoader
+    load_scene = DataLoader._load_scene
+    loaded = []
+    
+    def failing_load(self, img_file):
+        if loaded:
+            raise RuntimeError("interrupted")
+        loaded.append(img_file)
+        return load_scene(self, img_file)
+    
+    monkeypatch.setattr(DataLoader, '_load_scene', failing_load)
+    with pytest.raises(RuntimeError):
+        NitrogenEstimationPipeline(sample_data_dir, output_dir, checkpoint=True).run_pipeline()
+    assert len(loaded) == 1
+    
+    # Only the second scene is read when resuming
+    def counting_load(self, img_file):
+        loaded.append(img_file)
+        return load_scene(self, img_file)
+    
+    monkeypatch.setattr(DataLoader, '_load_scene', counting_load)
+    pipeline = NitrogenEstimationPipeline(sample_data_dir, output_dir, checkpoint=True)
+    assert len(pipeline.run_pipeline()) == 2
+    assert [Path(f).name for f in loaded] == ["synthetic_20240201.tif", "synthetic_20240210.tif"]
+    
+    manifest = json.loads((output_dir / "manifest.json").read_text())
+    assert sorted(manifest['scenes']) == ["synthetic_20240201.tif", "synthetic_20240210.tif"]
+    assert set(manifest['stages']) == {"plots", "report"}
+    
+    # A complete run is not redone
+    def no_plots(self, df):
+        raise AssertionError("plots are up to date")
+    
+    monkeypatch.setattr(NitrogenEstimationPipeline, '_plot_time_series_analysis', no_plots)
+    pipeline = NitrogenEstimationPipeline(sample_data_dir, output_dir, checkpoint=True)
+    pipeline.run_pipeline()
+    assert len(loaded) == 2
+    assert len(pd.read_csv(output_dir / "nitrogen_analysis.csv")) == 2
+
+def test_pipeline_loads_scenes_in_thread_pool(sample_data_dir, output_dir, monkeypatch):
+    """Test max_workers loads scenes on pool threads, still in date order"""
+    import threading
+    from wheat_n_estimation.data_loader import DataLoader
+    
+    threads = []
+    load_scene = DataLoader._load_scene
+    def recording_load(self, img_file):
+        threads.append(threading.current_thread().name)
+        return load_scene(self, img_file)
+    monkeypatch.setattr(DataLoader, '_load_scene', recording_load)
+    
+    pipeline = NitrogenEstimationPipeline(sample_data_dir, output_dir, max_workers=4)
+    results = pipeline.run_pipeline()
+    
+    assert len(threads) == 2
+    assert 'MainThread' not in threads
+    assert [r['date'] for r in results] == sorted(r['date'] for r in results)
+    
+    # Maps only need the scene paths, not the scene statistics again
+    assert len(pipeline.write_n_maps()) == 2
+    assert len(threads) == 2
+
+def test_pipeline_without_matching_scenes(sample_data_dir, output_dir):
+    """Test filters matching no scene give the loader's error message"""
+    pipeline = NitrogenEstimationPipeline(sample_data_dir, output_dir, start_date='2030-01-01')
+    
+    with pytest.raises(ValueError, match="match the date and bounds filters"):
+        pipeline.run_pipeline()
+    with pytest.raises(ValueError, match="match the date and bounds filters"):
+        pipeline.write_n_maps()
+
+def test_n_maps_clipped_to_bounds(sample_data_dir, output_dir):
+    """Test the maps of a bounds filter only cover the pixels within the bounds"""
+    # Pixel columns 2-5 and rows 3-7 (origin at 0, 0 with 1 m pixels)
+    pipeline = NitrogenEstimationPipeline(sample_data_dir, output_dir, bounds=(2, -8, 6, -3))
+    map_files = pipeline.write_n_maps()
+    
+    assert len(map_files) == 2
+    for map_file in map_files:
+        with rasterio.open(map_file) as dst:
+            assert (dst.height, dst.width) == (5, 4)
+            assert dst.transform == rasterio.transform.from_origin(2, -3, 1, 1)
+
+def test_merge_rejects_shards_of_different_scene_sets(sample_data_dir, output_dir, write_image):
+    """Test shards started on different directory listings are not merged"""
+    NitrogenEstimationPipeline(sample_data_dir, output_dir, shard=(0, 2)).run_pipeline()
+    write_image(sample_data_dir / "synthetic_20240220.tif", shape=(10, 10), date="2024-02-20")
+    NitrogenEstimationPipeline(sample_data_dir, output_dir, shard=(1, 2)).run_pipeline()
+    
+    with pytest.raises(ValueError, match="different scene sets"):
+        NitrogenEstimationPipeline(None, output_dir).merge_shards()
+    
+    # Re-running every shard on the same listing merges all scenes once
+    NitrogenEstimationPipeline(sample_data_dir, output_dir, shard=(0, 2)).run_pipeline()
+    predictions = NitrogenEstimationPipeline(None, output_dir).merge_shards()
+    assert len(predictions) == 3
@@ -0,0 +1,40 @@
+"""Tests for the shard assignment of array jobs."""
+
+import random
+import pytest
+from wheat_n_estimation.sharding import assign_shards, parse_shard, scene_set_digest
+
+def test_parse_shard():
+    """Test shard specifications are validated"""
+    assert parse_shard("3/16") == (3, 16)
+    assert parse_shard(" 0/1 ") == (0, 1)
+    for text in ["16/16", "1", "-1/4", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+def test_assignment_is_stable_and_balanced():
+    """Test the assignment ignores listing order and balances total sizes"""
+    rng = random.Random(0)
+    sizes = {f"scene_{i:03d}.tif": rng.randint(1, 100) * 1_000_000 for i in range(200)}
+    assignment = assign_shards(sizes, 8)
+    
+    shuffled = list(sizes.items())
+    rng.shuffle(shuffled)
+    assert assign_shards(dict(shuffled), 8) == assignment
+    
+    loads = [sum(size for key, size in sizes.items() if assignment[key] == shard)
+             for shard in range(8)]
+    assert max(loads) - min(loads) <= max(sizes.values())
+
+def test_equal_sizes_split_evenly():
+    """Test equally sized items are spread one by one over the shards"""
+    assignment = assign_shards({f"scene_{i}.tif": 100 for i in range(10)}, 4)
+    counts = sorted(list(assignment.values()).count(shard) for shard in range(4))
+    assert counts == [2, 2, 3, 3]
+
+def test_scene_set_digest():
+    """Test the digest ignores listing order but not names or sizes"""
+    sizes = {"a.tif": 10, "b.tif": 20}
+    assert scene_set_digest(sizes) == scene_set_digest({"b.tif": 20, "a.tif": 10})
+    assert scene_set_digest(sizes) != scene_set_digest({"a.tif": 10, "b.tif": 21})
+    assert scene_set_digest(sizes) != scene_set_digest({**sizes, "c.tif": 1})
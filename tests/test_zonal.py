@@ -0,0 +1,153 @@
+"""Tests for the zonal plot statistics."""
+
+import pytest
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+from datetime import datetime
+from shapely.geometry import box
+from wheat_n_estimation import DataLoader, NitrogenEstimator
+
+CRS = 'EPSG:32632'
+
+@pytest.fixture
+def plot_image_dir(tmp_path, write_image):
+    """Create tiled images with two dates over a 1 m grid"""
+    img_dir = tmp_path / "plot_images"
+    img_dir.mkdir()
+    
+    transform = rasterio.transform.from_origin(500000, 5300040, 1, 1)
+    for date in [datetime(2024, 3, 1), datetime(2024, 3, 11)]:
+        bands = np.random.uniform(0.1, 0.5, (5, 40, 56)).astype(np.float32)
+        write_image(img_dir / f"synthetic_{date.strftime('%Y%m%d')}.tif", bands,
+                    date=date.strftime("%Y-%m-%d"), crs=CRS, transform=transform)
+    return img_dir
+
+@pytest.fixture
+def plots():
+    """Two rectangular plots, one spanning several image blocks"""
+    return gpd.GeoDataFrame(
+        {'plot': ['A', 'B']},
+        geometry=[
+            box(500002, 5300030, 500010, 5300038),  # rows 2-9, cols 2-9
+            box(500010, 5300005, 500050, 5300025)   # rows 15-34, cols 10-49
+        ],
+        crs=CRS
+    )
+
+def test_zonal_means_match_direct_computation(plot_image_dir, plots):
+    """Test per-plot band means match means over the plot pixels"""
+    loader = DataLoader(plot_image_dir)
+    df = loader.load_zonal_time_series(plots, id_column='plot')
+    
+    assert len(df) == 4
+    assert list(df.columns[:2]) == ['plot_id', 'date']
+    assert df['date'].is_monotonic_increasing
+    
+    first = df[df['date'] == datetime(2024, 3, 1)].set_index('plot_id')
+    with rasterio.open(plot_image_dir / "synthetic_20240301.tif") as src:
+        image = src.read()
+    
+    assert first.loc['A', 'pixel_count'] == 64
+    assert first.loc['B', 'pixel_count'] == 800
+    for i, band in enumerate(['blue', 'green', 'red', 'nir', 'red_edge']):
+        assert first.loc['A', band] == pytest.approx(image[i, 2:10, 2:10].mean(), rel=1e-6)
+        assert first.loc['B', band] == pytest.approx(image[i, 15:35, 10:50].mean(), rel=1e-6)
+
+def test_zonal_means_clipped_to_bounds(plot_image_dir, plots):
+    """Test a bounds filter restricts the plots to the pixels within it"""
+    # Rows and columns 0-29
+    df = DataLoader(plot_image_dir, bounds=(500000, 5300010, 500030, 5300040)).load_zonal_time_series(
+        plots, id_column='plot')
+    first = df[df['date'] == datetime(2024, 3, 1)].set_index('plot_id')
+    with rasterio.open(plot_image_dir / "synthetic_20240301.tif") as src:
+        image = src.read()
+    
+    assert first.loc['A', 'pixel_count'] == 64
+    assert first.loc['B', 'pixel_count'] == 300
+    for i, band in enumerate(['blue', 'green', 'red', 'nir', 'red_edge']):
+        assert first.loc['B', band] == pytest.approx(image[i, 15:30, 10:30].mean(), rel=1e-6)
+
+def test_zonal_table_feeds_batch_estimation(plot_image_dir, plots):
+    """Test the plot x date table goes straight into batch estimation"""
+    loader = DataLoader(plot_image_dir)
+    loader.load_zonal_time_series(plots, id_column='plot')
+    indices = loader.calculate_vegetation_indices_frame()
+    results = NitrogenEstimator().predict_batch(indices)
+    
+    assert list(results.columns[:2]) == ['plot_id', 'date']
+    assert results['plot_id'].tolist() == ['A', 'B', 'A', 'B']
+    assert results['valid'].all()
+
+def test_label_grid_cache_reused_across_runs(plot_image_dir, plots, tmp_path, monkeypatch):
+    """Test cached label grids are reused instead of rasterizing again"""
+    from wheat_n_estimation.zonal import ZonalStatistics
+    
+    cache_dir = tmp_path / "label_cache"
+    first = DataLoader(plot_image_dir).load_zonal_time_series(
+        plots, id_column='plot', label_cache_dir=cache_dir)
+    assert len(list(cache_dir.glob('labels_*.npy'))) == 1
+    
+    def fail(*args, **kwargs):
+        raise AssertionError("plots were rasterized again")
+    monkeypatch.setattr(ZonalStatistics, '_rasterize', fail)
+    
+    second = DataLoader(plot_image_dir).load_zonal_time_series(
+        plots, id_column='plot', label_cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(second, first)
+
+def test_label_grid_cache_evicts_least_recently_used(plots, tmp_path):
+    """Test the on-disk cache keeps at most max_entries grids"""
+    from wheat_n_estimation.zonal import ZonalStatistics
+    
+    zonal = ZonalStatistics(plots, cache_dir=tmp_path / "label_cache", max_cached_grids=2)
+    crs = rasterio.crs.CRS.from_string(CRS)
+    for size in [1, 2, 4]:
+        transform = rasterio.transform.from_origin(500000, 5300040, size, size)
+        labels = zonal.label_grid(crs, transform, (40 // size, 56 // size))
+        assert labels.max() == 2
+    
+    assert len(list((tmp_path / "label_cache").glob('labels_*.npy'))) == 2
+    assert len(zonal._label_grids) == 2
+
+def test_labels_rasterized_per_block_without_cache(plot_image_dir, plots, tmp_path, monkeypatch):
+    """Test uncached labels are rasterized per block in the smallest dtype"""
+    from wheat_n_estimation import zonal as zonal_module
+    from wheat_n_estimation.zonal import ZonalStatistics, label_dtype
+    
+    shapes = []
+    rasterize = zonal_module.features.rasterize
+    def recording_rasterize(*args, **kwargs):
+        labels = rasterize(*args, **kwargs)
+        shapes.append(labels.shape)
+        assert labels.dtype == np.uint8
+        return labels
+    monkeypatch.setattr(zonal_module.features, 'rasterize', recording_rasterize)
+    
+    img_file = next(plot_image_dir.glob('*.tif'))
+    with rasterio.open(img_file) as src:
+        per_block = ZonalStatistics(plots, id_column='plot').plot_means(src)
+        cached = ZonalStatistics(plots, id_column='plot', cache_dir=tmp_path / "cache").plot_means(src)
+    
+    pd.testing.assert_frame_equal(per_block, cached)
+    assert all(max(shape) <= 16 for shape in shapes[:-1])
+    assert shapes[-1] == (40, 56)
+    assert label_dtype(255) == np.uint8 and label_dtype(256) == np.uint16
+
+def test_block_labels_reused_across_dates(plot_image_dir, plots, monkeypatch):
+    """Test blocks of a grid are rasterized once for the whole time series"""
+    from wheat_n_estimation.zonal import ZonalStatistics
+    
+    windows = []
+    rasterize = ZonalStatistics._rasterize
+    def recording_rasterize(self, crs, transform, shape, window=None):
+        windows.append(window)
+        return rasterize(self, crs, transform, shape, window)
+    monkeypatch.setattr(ZonalStatistics, '_rasterize', recording_rasterize)
+    
+    df = DataLoader(plot_image_dir).load_zonal_time_series(plots, id_column='plot')
+    
+    assert len(df) == 4
+    # Twelve 16-pixel blocks, rasterized for the first date only
+    assert len(windows) == 12
@@ -9,8 +9,14 @@ __version__ = "1.0.0"
 __author__ = "Your Name"
 __email__ = "your.email@example.com"
 
-from .data_loader import DataLoader
+from .batch import BatchRunner
+from .catalog import SceneCatalog
+from .data_loader import DataLoader, Scene
+from .job_queue import JobQueue
 from .n_estimator import NitrogenEstimator
+from .nitrogen_map import NitrogenMapper
 from .pipeline import NitrogenEstimationPipeline
+from .zonal import ZonalStatistics
 
-__all__ = ['DataLoader', 'NitrogenEstimator', 'NitrogenEstimationPipeline'] 
\ No newline at end of file
+__all__ = ['BatchRunner', 'DataLoader', 'JobQueue', 'NitrogenEstimator', 'NitrogenEstimationPipeline',
+           'NitrogenMapper', 'Scene', 'SceneCatalog', 'ZonalStatistics'] 
\ No newline at end of file
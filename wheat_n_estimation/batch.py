@@ -0,0 +1,346 @@
+"""Batch processing of many field directories across a process pool."""
+
+import glob
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import pandas as pd
+from .job_queue import DONE, FAILED, JobQueue, default_worker_id
+from .pipeline import NitrogenEstimationPipeline, add_loader_arguments, loader_options
+
+# Consolidated outputs in the batch output directory
+RESULTS_FILE = 'batch_results.csv'
+FAILURES_FILE = 'batch_failures.csv'
+
+# Longest wait of an idle queue worker before checking for reclaimable jobs
+QUEUE_POLL_SECONDS = 2
+
+def field_dirs(fields):
+    """
+    Resolve field directories from paths and glob patterns
+
+    Args:
+        fields (str or list): Directory paths or glob patterns, e.g.
+            'farm/fields/*'
+
+    Returns:
+        list: Sorted, unique field directories
+    """
+    if isinstance(fields, (str, Path)):
+        fields = [fields]
+
+    dirs = set()
+    for field in fields:
+        matches = glob.glob(str(field)) if glob.has_magic(str(field)) else [field]
+        dirs.update(Path(match) for match in matches if Path(match).is_dir())
+    return sorted(dirs)
+
+def run_field(data_dir, output_dir, options, pixel_maps=False, map_dtype='float32'):
+    """
+    Run the pipeline for one field
+
+    Executed in a worker process. Errors are caught and reported, so one
+    broken field never stops the others.
+
+    Args:
+        data_dir (str): Field directory with the drone images
+        output_dir (str): Output directory of the field
+        options (dict): DataLoader options
+        pixel_maps (bool): Also write per-pixel N maps
+        map_dtype (str): Precision of the per-pixel N maps
+
+    Returns:
+        dict: 'field' and 'status' ('ok' or 'failed') with the field's
+            'results' table, or 'error', 'message' and 'traceback'
+    """
+    field = Path(data_dir).name
+    try:
+        pipeline = NitrogenEstimationPipeline(data_dir, output_dir, **options)
+        pipeline.run_pipeline()
+        if pixel_maps:
+            pipeline.write_n_maps(dtype=map_dtype)
+    except Exception as e:
+        return {
+            'field': field,
+            'status': 'failed',
+            'error': type(e).__name__,
+            'message': str(e),
+            'traceback': traceback.format_exc()
+        }
+
+    results = pipeline.results.copy()
+    results.insert(0, 'field', field)
+    return {'field': field, 'status': 'ok', 'results': results}
+
+def work_queue(queue_path, output_dir, options, pixel_maps=False, map_dtype='float32',
+               lease_seconds=600, max_attempts=3):
+    """
+    Run fields claimed from a job queue until none is left
+
+    Executed in a worker process on any node. The lease of the current
+    field is renewed while it runs; once no job is claimable, the worker
+    waits for the leases of running jobs, so fields of crashed workers are
+    picked up, and returns when every job is done or failed.
+
+    Args:
+        queue_path (str): Path of the JobQueue database
+        output_dir (str): Batch output directory
+        options (dict): DataLoader options
+        pixel_maps (bool): Also write per-pixel N maps
+        map_dtype (str): Precision of the per-pixel N maps
+        lease_seconds (float): Lease time of claimed jobs
+        max_attempts (int): Claims per job before it is marked failed
+
+    Returns:
+        int: Number of fields processed by this worker
+    """
+    queue = JobQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    worker = default_worker_id()
+    processed = 0
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            expiry = queue.next_expiry()
+            if expiry is None:
+                return processed
+            time.sleep(min(max(expiry - time.time(), 0.1), QUEUE_POLL_SECONDS))
+            continue
+
+        with queue.heartbeat(job['name'], worker):
+            outcome = run_field(job['payload']['data_dir'], str(Path(output_dir) / job['name']),
+                                options, pixel_maps, map_dtype)
+        if outcome['status'] == 'ok':
+            queue.complete(job['name'], worker)
+        else:
+            queue.fail(job['name'], worker, f"{outcome['error']}: {outcome['message']}")
+        processed += 1
+
+class BatchRunner:
+    """
+    Nitrogen estimation for many field directories in parallel.
+
+    Every field runs the full pipeline (loading, estimation, tables, plots
+    and optional N maps) in a worker process, with its own output
+    subdirectory named after the field. Fields are independent tasks, so
+    throughput scales with the number of processes. The results of all
+    fields are consolidated into batch_results.csv and failures are listed
+    in batch_failures.csv.
+    """
+
+    def __init__(self, output_dir, processes=None, pixel_maps=False, map_dtype='float32',
+                 **loader_options):
+        """
+        Initialize the batch runner
+
+        Args:
+            output_dir (str): Directory for the per-field and consolidated
+                outputs
+            processes (int, optional): Number of worker processes. Defaults
+                to the number of CPUs.
+            pixel_maps (bool): Also write per-pixel N maps for every field
+            map_dtype (str): Precision of the per-pixel N maps
+            **loader_options: Keyword arguments passed on to each field's
+                pipeline (checkpoint) and DataLoader
+        """
+        self.output_dir = Path(output_dir)
+        if self.output_dir.exists() and not self.output_dir.is_dir():
+            raise ValueError(f"Output path {self.output_dir} is not a directory")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        self.processes = processes
+        self.pixel_maps = pixel_maps
+        self.map_dtype = map_dtype
+        self.loader_options = loader_options
+
+    def run(self, fields):
+        """
+        Process the fields and write the consolidated outputs
+
+        Args:
+            fields (str or list): Field directories or glob patterns
+
+        Returns:
+            dict: 'results' (all field estimates with a 'field' column) and
+                'failures' (field, error and message per failed field)
+        """
+        dirs = self._field_dirs(fields)
+
+        print(f"Processing {len(dirs)} fields...")
+        outcomes = self._run_pool(dirs, self.processes)
+
+        # A crashed worker breaks the pool for every pending field, so
+        # those are retried one per pool to isolate the culprit
+        crashed = [data_dir for data_dir in dirs if outcomes[data_dir] is None]
+        for data_dir in crashed:
+            outcomes.update(self._run_pool([data_dir], 1))
+
+        return self._consolidate([outcomes[data_dir] or self._crash(data_dir) for data_dir in dirs])
+
+    def run_queue(self, queue, fields=None, lease_seconds=600, max_attempts=3,
+                  retry_failed=False):
+        """
+        Process fields from a shared job queue and write the consolidated outputs
+
+        Runs the same way on every node that shares the queue and the output
+        directory: the given fields are added to the queue (fields already
+        queued keep their state), then independent worker processes claim
+        fields until the queue is drained. Re-running after an interruption
+        only processes the fields that are not done yet.
+
+        Args:
+            queue (str): Path of the JobQueue database on the shared filesystem
+            fields (str or list, optional): Field directories or glob patterns
+                to add to the queue
+            lease_seconds (float): Time after which the field of a worker
+                that stopped renewing its lease is reclaimed
+            max_attempts (int): Claims per field before it is marked failed
+            retry_failed (bool): Queue failed fields again
+
+        Returns:
+            dict: 'results' and 'failures' of all fields in the queue
+        """
+        job_queue = JobQueue(queue, lease_seconds=lease_seconds, max_attempts=max_attempts)
+        if fields is not None:
+            added = job_queue.add({data_dir.name: {'data_dir': str(data_dir.resolve())}
+                                   for data_dir in self._field_dirs(fields)})
+            print(f"Queued {added} new fields")
+        if retry_failed:
+            job_queue.retry_failed()
+
+        counts = job_queue.counts()
+        print(f"Queue: {', '.join(f'{count} {status}' for status, count in counts.items())}")
+
+        # Independent processes rather than a pool: a crashed worker must not
+        # take the others down, its field is reclaimed when the lease expires
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(
+                target=work_queue,
+                args=(str(job_queue.path), str(self.output_dir), self.loader_options,
+                      self.pixel_maps, self.map_dtype, lease_seconds, max_attempts)
+            )
+            for _ in range(self.processes or os.cpu_count())
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        outcomes = []
+        for job in job_queue.jobs():
+            if job['status'] == DONE:
+                results = pd.read_csv(self.output_dir / job['name'] / 'nitrogen_analysis.csv')
+                results.insert(0, 'field', job['name'])
+                outcomes.append({'field': job['name'], 'status': 'ok', 'results': results})
+            elif job['status'] == FAILED:
+                error, _, message = job['error'].partition(': ')
+                outcomes.append({'field': job['name'], 'status': 'failed',
+                                 'error': error, 'message': message})
+        return self._consolidate(outcomes)
+
+    @staticmethod
+    def _field_dirs(fields):
+        """Resolve field directories whose names serve as output subdirectories"""
+        dirs = field_dirs(fields)
+        if not dirs:
+            raise ValueError(f"No field directories found for {fields}")
+        names = [data_dir.name for data_dir in dirs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Field directory names must be unique: {', '.join(duplicates)}")
+        return dirs
+
+    def _run_pool(self, dirs, processes):
+        """Run fields in a process pool; None marks fields lost to a crash"""
+        outcomes = {}
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            futures = {
+                executor.submit(
+                    run_field, str(data_dir), str(self.output_dir / data_dir.name),
+                    self.loader_options, self.pixel_maps, self.map_dtype
+                ): data_dir
+                for data_dir in dirs
+            }
+            for future in as_completed(futures):
+                try:
+                    outcomes[futures[future]] = future.result()
+                except BrokenProcessPool:
+                    outcomes[futures[future]] = None
+        return outcomes
+
+    @staticmethod
+    def _crash(data_dir):
+        return {
+            'field': data_dir.name,
+            'status': 'failed',
+            'error': 'BrokenProcessPool',
+            'message': 'Worker process terminated abruptly'
+        }
+
+    def _consolidate(self, outcomes):
+        """Write the consolidated results and the failure summary"""
+        tables = [outcome['results'] for outcome in outcomes if outcome['status'] == 'ok']
+        results = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+        failures = pd.DataFrame(
+            [{key: outcome[key] for key in ('field', 'error', 'message')}
+             for outcome in outcomes if outcome['status'] == 'failed'],
+            columns=['field', 'error', 'message']
+        )
+
+        # Replace atomically, as nodes sharing a queue may consolidate concurrently
+        for table, name in ((results, RESULTS_FILE), (failures, FAILURES_FILE)):
+            tmp_file = self.output_dir / f".{name}.{default_worker_id()}"
+            table.to_csv(tmp_file, index=False)
+            os.replace(tmp_file, self.output_dir / name)
+
+        print(f"\n{len(outcomes) - len(failures)} of {len(outcomes)} fields processed successfully")
+        for failure in failures.itertuples():
+            print(f"  Failed: {failure.field}: {failure.error}: {failure.message}")
+        return {'results': results, 'failures': failures}
+
+def main():
+    """Run the pipeline for many field directories"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Estimate above-ground nitrogen content for many fields in parallel')
+    parser.add_argument('--fields', required=True, nargs='+',
+                      help='Field directories or glob patterns, e.g. "fields/*"')
+    parser.add_argument('--output_dir', required=True,
+                      help='Directory for the per-field and consolidated outputs')
+    parser.add_argument('--processes', type=int, default=None,
+                      help='Number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--queue', default=None,
+                      help='Shared job queue database; run the same command on every node '
+                           'to share the fields and resume interrupted runs')
+    parser.add_argument('--lease', type=float, default=600,
+                      help='Seconds after which fields of stopped workers are reclaimed')
+    parser.add_argument('--retry_failed', action='store_true',
+                      help='Queue fields that failed in an earlier run again')
+    add_loader_arguments(parser)
+
+    args = parser.parse_args()
+
+    runner = BatchRunner(
+        args.output_dir,
+        processes=args.processes,
+        pixel_maps=args.pixel_maps,
+        map_dtype=args.map_precision,
+        checkpoint=args.checkpoint,
+        **loader_options(args)
+    )
+    if args.queue:
+        summary = runner.run_queue(args.queue, args.fields, lease_seconds=args.lease,
+                                   retry_failed=args.retry_failed)
+    else:
+        summary = runner.run(args.fields)
+    if len(summary['failures']):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Persistent catalog of per-scene band statistics."""
+
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Bytes hashed from the start and the end of a file (TIFF header and IFDs)
+FINGERPRINT_EDGE = 1024 * 1024
+# Chunks hashed at evenly spaced offsets in between, and their size
+FINGERPRINT_SAMPLES = 16
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+class SceneCatalog:
+    """
+    SQLite catalog of scene statistics keyed by path, size, mtime and
+    content fingerprint.
+
+    Scenes whose size and mtime are unchanged are served from the catalog
+    without opening the image. If only the mtime changed (e.g. the file was
+    copied or touched), the content fingerprint decides whether the stored
+    statistics are still valid.
+
+    The fingerprint covers the size, header, tail and evenly spaced sample
+    chunks of a file, so fingerprinting a new multi-GB orthomosaic costs a
+    few MB of reads instead of a second full pass over it. A rewrite that
+    only changes pixels between the sampled chunks, keeping the size, is
+    taken for a touched copy.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the catalog
+
+        Args:
+            path (str): Path of the SQLite database, created if missing
+        """
+        self.path = Path(path)
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS scenes (
+                    path TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    stats TEXT NOT NULL,
+                    PRIMARY KEY (path, mode)
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def fingerprint(img_file):
+        """
+        Bounded content fingerprint of a file
+
+        Hashes the file size, the first and last FINGERPRINT_EDGE bytes and
+        FINGERPRINT_SAMPLES evenly spaced chunks in between; smaller files
+        are hashed completely. Only computed for new files and files whose
+        mtime changed, so unchanged scenes are checked with a single stat
+        call.
+
+        Args:
+            img_file (str): Path of the image
+
+        Returns:
+            str: Hex digest
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(img_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            digest.update(size.to_bytes(8, 'little'))
+            if size <= 2 * FINGERPRINT_EDGE + FINGERPRINT_SAMPLES * FINGERPRINT_SAMPLE_SIZE:
+                digest.update(f.read())
+                return digest.hexdigest()
+
+            digest.update(f.read(FINGERPRINT_EDGE))
+            span = size - 2 * FINGERPRINT_EDGE - FINGERPRINT_SAMPLE_SIZE
+            for i in range(FINGERPRINT_SAMPLES):
+                f.seek(FINGERPRINT_EDGE + span * i // (FINGERPRINT_SAMPLES - 1))
+                digest.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+            f.seek(size - FINGERPRINT_EDGE)
+            digest.update(f.read(FINGERPRINT_EDGE))
+        return digest.hexdigest()
+
+    def lookup(self, img_file, mode):
+        """
+        Get the stored statistics of a scene if the file is unchanged
+
+        Args:
+            img_file (str): Path of the image
+            mode (str): Name of the reduction that produced the statistics
+
+        Returns:
+            dict: Scene record with 'date' and band statistics, or None if
+                the scene is unknown or has changed
+        """
+        key = str(Path(img_file).resolve())
+        stat = os.stat(img_file)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size, mtime_ns, fingerprint, date, stats FROM scenes "
+                "WHERE path = ? AND mode = ?",
+                (key, mode)
+            ).fetchone()
+            if row is None:
+                return None
+
+            size, mtime_ns, fingerprint, date, stats = row
+            if size != stat.st_size:
+                return None
+            if mtime_ns != stat.st_mtime_ns:
+                if self.fingerprint(img_file) != fingerprint:
+                    return None
+                conn.execute(
+                    "UPDATE scenes SET mtime_ns = ? WHERE path = ? AND mode = ?",
+                    (stat.st_mtime_ns, key, mode)
+                )
+
+        return {'date': datetime.fromisoformat(date), **json.loads(stats)}
+
+    def store(self, img_file, mode, record):
+        """
+        Store the statistics of a scene
+
+        Args:
+            img_file (str): Path of the image
+            mode (str): Name of the reduction that produced the statistics
+            record (dict): Scene record with 'date' and band statistics
+        """
+        self.store_many([(img_file, record)], mode)
+
+    def store_many(self, items, mode):
+        """
+        Store the statistics of several scenes in one transaction
+
+        Args:
+            items (list): (image path, scene record) pairs
+            mode (str): Name of the reduction that produced the statistics
+        """
+        rows = []
+        for img_file, record in items:
+            stat = os.stat(img_file)
+            stats = {k: v for k, v in record.items() if k != 'date'}
+            rows.append((
+                str(Path(img_file).resolve()),
+                mode,
+                stat.st_size,
+                stat.st_mtime_ns,
+                self.fingerprint(img_file),
+                record['date'].isoformat(),
+                json.dumps(stats)
+            ))
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scenes "
+                "(path, mode, size, mtime_ns, fingerprint, date, stats) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
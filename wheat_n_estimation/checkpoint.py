@@ -0,0 +1,125 @@
+"""Manifest of the scenes and stages completed by a pipeline run."""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+# Checkpoint files in the output directory
+CHECKPOINT_DIR = 'checkpoints'
+CHECKPOINT_CATALOG = 'scenes.sqlite'
+MANIFEST_NAME = 'manifest.json'
+
+def scene_inputs(img_files):
+    """
+    Identity of images as stage inputs
+
+    Args:
+        img_files (list): Image paths
+
+    Returns:
+        list: File name, size and mtime per image
+    """
+    inputs = []
+    for img_file in img_files:
+        stat = os.stat(img_file)
+        inputs.append({'file': Path(img_file).name, 'size': stat.st_size,
+                       'mtime_ns': stat.st_mtime_ns})
+    return inputs
+
+class RunManifest:
+    """
+    JSON manifest recording what a run has processed.
+
+    Lists the processed scenes and the completed stages, each stage with a
+    fingerprint of its inputs (scenes and settings) and its output files. A
+    re-run of the same command skips stages whose inputs are unchanged and
+    whose outputs still exist. Every update replaces the file atomically, so
+    an interrupted run leaves the last complete state behind.
+    """
+
+    def __init__(self, path, config):
+        """
+        Load the manifest of an earlier run or start a new one
+
+        Args:
+            path (str): Path of the manifest file
+            config (dict): Run settings (JSON serializable). A manifest
+                written with other settings is discarded.
+        """
+        self.path = Path(path)
+        self.config = json.loads(json.dumps(config, default=str))
+        self.data = None
+        if self.path.exists():
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('config') == self.config:
+                self.data = data
+            else:
+                print(f"Settings changed since the last run, ignoring {self.path}")
+        if self.data is None:
+            self.data = {'config': self.config, 'scenes': {}, 'stages': {}}
+
+    @staticmethod
+    def fingerprint(inputs):
+        """Digest of JSON serializable stage inputs"""
+        return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def scene_done(self, img_file, date, valid):
+        """
+        Record a processed scene
+
+        Args:
+            img_file (str): Path of the image
+            date (datetime): Acquisition date
+            valid (bool): Whether an N content estimate was possible
+        """
+        entry = scene_inputs([img_file])[0]
+        self.data['scenes'][entry.pop('file')] = {**entry, 'date': date.isoformat(), 'valid': bool(valid)}
+        self.save()
+
+    def completed(self, stage, inputs):
+        """
+        Whether a stage was completed with the same inputs
+
+        Args:
+            stage (str): Stage name
+            inputs: JSON serializable inputs of the stage
+
+        Returns:
+            bool: True if the stage is recorded with these inputs and all of
+                its outputs exist
+        """
+        record = self.data['stages'].get(stage)
+        if record is None or record['inputs'] != self.fingerprint(inputs):
+            return False
+        return all((self.path.parent / output).exists() for output in record['outputs'])
+
+    def outputs(self, stage):
+        """Output paths of a completed stage"""
+        return [self.path.parent / output for output in self.data['stages'][stage]['outputs']]
+
+    def complete(self, stage, inputs, outputs=()):
+        """
+        Record a completed stage
+
+        Args:
+            stage (str): Stage name
+            inputs: JSON serializable inputs of the stage
+            outputs (list): Files written by the stage
+        """
+        self.data['stages'][stage] = {
+            'inputs': self.fingerprint(inputs),
+            'outputs': [os.path.relpath(output, self.path.parent) for output in outputs],
+            'completed': datetime.now().isoformat(timespec='seconds')
+        }
+        self.save()
+
+    def save(self):
+        """Write the manifest atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        with open(tmp_file, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_file, self.path)
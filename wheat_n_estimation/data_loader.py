@@ -2,75 +2,1140 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import rasterio
+from rasterio.enums import Interleaving, Resampling
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
 from datetime import datetime
+from scipy import stats
+import queue
+import threading
+import zlib
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .catalog import SceneCatalog
+from .memmap import MemmapRaster
+from .sharding import assign_shards, scene_set_digest
+
+# Band order in the multispectral GeoTIFFs (1-based band indexes)
+BANDS = ('blue', 'green', 'red', 'nir', 'red_edge')
+BAND_INDEXES = [1, 2, 3, 4, 5]
+
+# Vegetation indices derived from the band means
+INDEX_NAMES = ('NDVI', 'NDRE', 'SAVI', 'GNDVI', 'MCARI', 'CIred-edge')
+
+# Default catalog file name inside the data directory
+CATALOG_NAME = 'scene_catalog.sqlite'
+
+# Read size of the scene read-ahead thread
+READ_AHEAD_CHUNK = 4 * 1024 * 1024
+
+def compute_vegetation_indices(bands, dtype=None):
+    """
+    Calculate vegetation indices as whole-array operations
+    
+    Args:
+        bands (dict or pd.DataFrame): Reflectance arrays (or columns) keyed by
+            band name ('green', 'red', 'nir', 'red_edge')
+        dtype (str or np.dtype, optional): Precision of the arithmetic, e.g.
+            float32 for pixel tiles. Defaults to numpy type promotion.
+            
+    Returns:
+        dict: Index arrays keyed by index name, same shape as the inputs
+    """
+    green = np.asarray(bands['green'], dtype=dtype)
+    red = np.asarray(bands['red'], dtype=dtype)
+    nir = np.asarray(bands['nir'], dtype=dtype)
+    red_edge = np.asarray(bands['red_edge'], dtype=dtype)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'NDVI': (nir - red) / (nir + red),
+            'NDRE': (nir - red_edge) / (nir + red_edge),
+            'SAVI': 1.5 * (nir - red) / (nir + red + 0.5),
+            'GNDVI': (nir - green) / (nir + green),
+            'MCARI': ((red_edge - red) - 0.2 * (red_edge - green)) * (red_edge / red),
+            'CIred-edge': (nir / red_edge) - 1
+        }
+
+def propagate_index_errors(bands, band_errors):
+    """
+    Propagate standard errors of the band means to the vegetation indices
+    
+    First-order (delta method) propagation using central differences, treating
+    the band errors as independent. Unknown (NaN) band errors give NaN index
+    errors.
+    
+    Args:
+        bands (dict or pd.DataFrame): Band means keyed by band name
+        band_errors (dict or pd.DataFrame): Standard errors keyed by band name
+            
+    Returns:
+        dict: Standard error arrays keyed by index name
+    """
+    bands = {band: np.asarray(bands[band], dtype=np.float64) for band in BANDS}
+    variances = {name: 0.0 for name in INDEX_NAMES}
+    
+    for band in BANDS:
+        if band not in band_errors:
+            continue
+        error = np.asarray(band_errors[band], dtype=np.float64)
+        upper = compute_vegetation_indices({**bands, band: bands[band] + error})
+        lower = compute_vegetation_indices({**bands, band: bands[band] - error})
+        for name in INDEX_NAMES:
+            variances[name] = variances[name] + ((upper[name] - lower[name]) / 2) ** 2
+    
+    return {name: np.sqrt(variance) for name, variance in variances.items()}
+
+def write_stats_sidecar(img_file, band_means):
+    """
+    Store band means as GDAL statistics in the .aux.xml sidecar of an image
+    
+    Existing sidecar metadata is kept; only STATISTICS_MEAN of the image
+    bands is replaced. The image file itself is not modified.
+    
+    Args:
+        img_file (str): Path of the image
+        band_means (dict): Mean value per band name
+    """
+    sidecar = Path(f"{img_file}.aux.xml")
+    if sidecar.exists():
+        root = ET.parse(sidecar).getroot()
+    else:
+        root = ET.Element('PAMDataset')
+    
+    for band, bidx in zip(BANDS, BAND_INDEXES):
+        band_elem = root.find(f"PAMRasterBand[@band='{bidx}']")
+        if band_elem is None:
+            band_elem = ET.SubElement(root, 'PAMRasterBand', band=str(bidx))
+        metadata = band_elem.find('Metadata')
+        if metadata is None:
+            metadata = ET.SubElement(band_elem, 'Metadata')
+        for item in metadata.findall('MDI'):
+            if item.get('key') in ('STATISTICS_MEAN', 'STATISTICS_APPROXIMATE'):
+                metadata.remove(item)
+        ET.SubElement(metadata, 'MDI', key='STATISTICS_MEAN').text = repr(band_means[band])
+    
+    tmp_file = sidecar.with_name(f"{sidecar.name}.tmp")
+    ET.ElementTree(root).write(tmp_file)
+    tmp_file.replace(sidecar)
+
+def has_nodata(src):
+    """
+    Check whether any band of an image declares a nodata value
+    
+    GDAL statistics exclude nodata pixels while the loader reductions
+    average every pixel, so stored statistics of such images are neither
+    used nor written.
+    
+    Args:
+        src (rasterio.DatasetReader): Open image
+        
+    Returns:
+        bool: True if a nodata value is set
+    """
+    return any(value is not None for value in src.nodatavals)
+
+def pixel_sums(data, axis=None):
+    """
+    Sum pixel values without upcasting the pixels
+    
+    Integer data (e.g. uint16 scaled reflectance) is summed exactly in int64,
+    float data is accumulated in float64.
+    
+    Args:
+        data (np.ndarray): Pixel values in their native dtype
+        axis (int or tuple, optional): Axes to sum over
+        
+    Returns:
+        np.ndarray: int64 or float64 sums
+    """
+    dtype = np.int64 if np.issubdtype(data.dtype, np.integer) else np.float64
+    return data.sum(axis=axis, dtype=dtype)
+
+def band_scaling(src):
+    """
+    Scale and offset converting stored pixel values to reflectance
+    
+    Args:
+        src (rasterio.DatasetReader): Open image
+        
+    Returns:
+        tuple: float64 arrays of scales and offsets in BANDS order, or None
+            if the bands carry no scaling (scale 1, offset 0)
+    """
+    scales = np.array([src.scales[bidx - 1] for bidx in BAND_INDEXES], dtype=np.float64)
+    offsets = np.array([src.offsets[bidx - 1] for bidx in BAND_INDEXES], dtype=np.float64)
+    if np.all(scales == 1) and np.all(offsets == 0):
+        return None
+    return scales, offsets
+
+def scale_band_statistics(band_stats, src):
+    """
+    Apply the band scale/offset to reduced values instead of every pixel
+    
+    Args:
+        band_stats (dict): Band means of stored pixel values, with optional
+            '<band>_se' and '<band>_ci_low'/'<band>_ci_high' entries
+        src (rasterio.DatasetReader): Open image
+        
+    Returns:
+        dict: Statistics in reflectance units
+    """
+    scaling = band_scaling(src)
+    if scaling is None:
+        return band_stats
+    
+    scaled = dict(band_stats)
+    for band, scale, offset in zip(BANDS, *scaling):
+        scale, offset = float(scale), float(offset)
+        for key in (band, f'{band}_ci_low', f'{band}_ci_high'):
+            if key in scaled:
+                scaled[key] = scaled[key] * scale + offset
+        if f'{band}_se' in scaled:
+            scaled[f'{band}_se'] = scaled[f'{band}_se'] * abs(scale)
+        if scale < 0 and f'{band}_ci_low' in scaled:
+            scaled[f'{band}_ci_low'], scaled[f'{band}_ci_high'] = \
+                scaled[f'{band}_ci_high'], scaled[f'{band}_ci_low']
+    return scaled
+
+def is_pixel_interleaved(src):
+    """
+    Check whether the bands of an image share their internal blocks
+    
+    Args:
+        src (rasterio.DatasetReader): Open image
+        
+    Returns:
+        bool: True for INTERLEAVE=PIXEL, False for band interleaving or
+            single band images
+    """
+    return src.count > 1 and src.interleaving == Interleaving.pixel
+
+def read_ahead(img_file, stop=None):
+    """
+    Read a file sequentially so later block reads hit the page cache
+    
+    Large sequential reads keep network mounts and spinning disks busy far
+    better than GDAL's scattered block reads. Only one chunk is held in
+    memory; errors are left for the actual read to report.
+    
+    Args:
+        img_file (str): Path of the file
+        stop (threading.Event, optional): Abort the read once set
+    """
+    buffer = bytearray(READ_AHEAD_CHUNK)
+    try:
+        with open(img_file, 'rb', buffering=0) as f:
+            while f.readinto(buffer):
+                if stop is not None and stop.is_set():
+                    return
+    except OSError:
+        pass
+
+def prefetch_scenes(scenes, depth):
+    """
+    Yield scenes while a background thread reads the next files ahead
+    
+    The thread reads each image (except scenes already served from the
+    catalog) before handing it over, and stays at most depth scenes ahead
+    of the consumer, so I/O of upcoming scenes overlaps the reduction and
+    estimation of the current one.
+    
+    Args:
+        scenes (list): Scenes in processing order
+        depth (int): Number of scenes read ahead
+        
+    Yields:
+        Scene: The given scenes, in order
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        for scene in scenes:
+            if scene._band_stats is None:
+                read_ahead(scene.path, stop)
+            if not put(scene):
+                return
+        put(done)
+    
+    thread = threading.Thread(target=produce, name='scene-read-ahead', daemon=True)
+    thread.start()
+    try:
+        while True:
+            scene = ready.get()
+            if scene is done:
+                break
+            yield scene
+    finally:
+        stop.set()
+        thread.join()
+
+def load_scenes(scenes, max_workers):
+    """
+    Yield scenes in order while a thread pool loads their band statistics
+    
+    At most twice max_workers scenes are in flight, so memory stays bounded
+    however long the series is, and scenes are yielded as soon as they and
+    all earlier scenes are loaded.
+    
+    Args:
+        scenes (list): Scenes in processing order
+        max_workers (int): Number of loading threads
+        
+    Yields:
+        Scene: The given scenes with band_stats loaded, in order
+    """
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for scene in scenes:
+            pending.append((scene, executor.submit(lambda scene: scene.band_stats, scene)))
+            if len(pending) >= 2 * max_workers:
+                scene, future = pending.popleft()
+                future.result()
+                yield scene
+        while pending:
+            scene, future = pending.popleft()
+            future.result()
+            yield scene
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def block_windows(src, window=None):
+    """
+    Internal block windows of an image, clipped to a window
+    
+    Args:
+        src (rasterio.DatasetReader): Open image
+        window (Window, optional): Window to clip to, the whole image if None
+        
+    Returns:
+        list: Windows of the blocks overlapping the window
+    """
+    blocks = [block for _, block in src.block_windows(1)]
+    if window is None:
+        return blocks
+    return [
+        block.intersection(window) for block in blocks
+        if rasterio.windows.intersect(block, window)
+    ]
+
+def parse_scene_date(src, img_file):
+    """Get the acquisition date from the image tags or the filename"""
+    date_str = src.tags().get('date')
+    if date_str:
+        return datetime.strptime(date_str, "%Y-%m-%d")
+    
+    # Try to parse from filename
+    date_str = Path(img_file).stem.split('_')[-1]
+    return datetime.strptime(date_str, "%Y%m%d")
+
+def indices_to_records(indices_df):
+    """
+    Convert an indices frame to the list-of-dicts layout used by
+    NitrogenEstimator.predict
+    
+    Args:
+        indices_df (pd.DataFrame): Frame with a 'date' column and one column
+            per vegetation index, plus '<index>_se' standard errors for
+            sampled or approximate loads
+            
+    Returns:
+        list: List of dictionaries containing indices (and their standard
+            errors) per timestamp
+    """
+    index_columns = [
+        column for name in INDEX_NAMES for column in (name, f'{name}_se')
+        if column in indices_df.columns
+    ]
+    dates = indices_df['date'].tolist()
+    values = indices_df[index_columns].to_dict('records')
+    return [{'date': date, 'indices': indices} for date, indices in zip(dates, values)]
+
+class Scene:
+    """
+    One image of the time series, evaluated lazily.
+    
+    Nothing is read on construction. The date and metadata come from the
+    GeoTIFF header, read once on first access, so catalog queries and date
+    filtering never touch pixel data. The dataset is opened on the first
+    pixel access and kept open until close(); bands, band means and
+    windowed reads are cached, so repeated access never re-reads a band.
+    
+    Attributes are held in __slots__ (many scenes per run), so the cached
+    properties are implemented by hand instead of functools.cached_property.
+    """
+    
+    __slots__ = ('path', 'loader', '_dataset', '_date', '_metadata', '_band_stats',
+                 '_bands', '_band_means', '_windows')
+    
+    def __init__(self, img_file, loader):
+        """
+        Initialize the scene without reading the image
+        
+        Args:
+            img_file (str): Path of the GeoTIFF
+            loader (DataLoader): Loader computing the band statistics
+        """
+        self.path = Path(img_file)
+        self.loader = loader
+        self._dataset = None
+        self._date = None
+        self._metadata = None
+        self._band_stats = None
+        self._bands = {}
+        self._band_means = None
+        self._windows = {}
+    
+    def __repr__(self):
+        return f"Scene({self.path.name!r})"
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @property
+    def dataset(self):
+        """Open rasterio dataset, opened on first access"""
+        if self._dataset is None:
+            self._dataset = rasterio.open(self.path)
+        return self._dataset
+    
+    def close(self):
+        """Close the dataset, keeping everything read so far"""
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+    
+    def _read_header(self):
+        if self._dataset is not None:
+            self._parse_header(self._dataset)
+        else:
+            # Header only, without keeping a file handle per scene
+            with rasterio.open(self.path) as src:
+                self._parse_header(src)
+    
+    def _parse_header(self, src):
+        if self._date is None:
+            self._date = parse_scene_date(src, self.path)
+        self._metadata = {
+            'width': src.width,
+            'height': src.height,
+            'count': src.count,
+            'dtype': src.dtypes[0],
+            'crs': src.crs,
+            'transform': src.transform,
+            'tags': src.tags()
+        }
+    
+    @property
+    def date(self):
+        """Acquisition date from the image tags or the filename"""
+        if self._date is None:
+            self._read_header()
+        return self._date
+    
+    @property
+    def metadata(self):
+        """Image size, band count, dtype, CRS, transform and tags"""
+        if self._metadata is None:
+            self._read_header()
+        return self._metadata
+    
+    @property
+    def band_stats(self):
+        """Record with 'date' and band statistics, as a row of load_time_series"""
+        if self._band_stats is None:
+            if self.loader._stats_mode() == 'mean' and len(self._bands) == len(BANDS):
+                self._band_stats = {'date': self.date, **self.band_means}
+            else:
+                self._band_stats = self.loader._scene_record(self.path)
+                self._date = self._band_stats['date']
+        return self._band_stats
+    
+    @property
+    def bands(self):
+        """Whole bands keyed by band name, in the stored dtype"""
+        missing = [band for band in BANDS if band not in self._bands]
+        if missing:
+            indexes = [BAND_INDEXES[BANDS.index(band)] for band in missing]
+            for band, values in zip(missing, self.dataset.read(indexes)):
+                self._bands[band] = values
+        return {band: self._bands[band] for band in BANDS}
+    
+    def band(self, name):
+        """
+        Read a single whole band
+        
+        Args:
+            name (str): Band name, e.g. 'nir'
+            
+        Returns:
+            np.ndarray: Band values in the stored dtype
+        """
+        if name not in self._bands:
+            self._bands[name] = self.dataset.read(BAND_INDEXES[BANDS.index(name)])
+        return self._bands[name]
+    
+    @property
+    def band_means(self):
+        """
+        Band means in reflectance units, as in band_stats
+        
+        Follow the loader's reduction (overviews, sampling, stored
+        statistics, bounds). For exact whole-image means they are taken
+        from the cached bands if those have been read, otherwise from the
+        loader (and its catalog) without keeping the pixels.
+        """
+        if self._band_means is None:
+            if len(self._bands) == len(BANDS) and self.loader._stats_mode() == 'mean':
+                means = {
+                    band: pixel_sums(values).item() / values.size
+                    for band, values in self._bands.items()
+                }
+                self._band_means = scale_band_statistics(means, self.dataset)
+            else:
+                stats = self.band_stats
+                self._band_means = {band: stats[band] for band in BANDS}
+        return self._band_means
+    
+    def read(self, window):
+        """
+        Read all bands within a window
+        
+        Windows are cached, and cut from the whole bands instead of read
+        from the file if those have been read already.
+        
+        Args:
+            window (rasterio.windows.Window): Window to read
+            
+        Returns:
+            np.ndarray: Array of shape (5, rows, cols) in BANDS order
+        """
+        key = (int(window.row_off), int(window.col_off), int(window.height), int(window.width))
+        if key not in self._windows:
+            if len(self._bands) == len(BANDS):
+                row_off, col_off, height, width = key
+                self._windows[key] = np.stack([
+                    self._bands[band][row_off:row_off + height, col_off:col_off + width]
+                    for band in BANDS
+                ])
+            else:
+                self._windows[key] = self.dataset.read(BAND_INDEXES, window=window)
+        return self._windows[key]
 
 class DataLoader:
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, streaming=False, max_workers=None, catalog=None,
+                 overview_level=None, sample_pixels=None, confidence=0.95,
+                 random_state=None, use_stored_stats=False, validate_stored_stats=False,
+                 write_stats=False, memmap=False, start_date=None, end_date=None,
+                 bounds=None, bounds_crs=None, prefetch=0, shard=None):
         """Initialize data loader
         
         Args:
             data_dir (str): Directory containing drone imagery data
+            streaming (bool): Reduce bands block by block instead of reading
+                whole bands into memory. Peak memory is bounded by one block
+                of the GeoTIFF regardless of the scene size.
+            max_workers (int, optional): Number of threads used to open and
+                reduce scenes concurrently. Scenes are read one after another
+                if not set.
+            catalog (bool or str, optional): Persistent scene catalog. True
+                keeps it next to the data, a path selects the SQLite file.
+                Only new or changed images are decoded when a catalog is used.
+            overview_level (int, optional): Approximate band means from a
+                reduced resolution instead of every pixel. Level n uses the
+                n-th GDAL overview of the image, or a decimated read by a
+                factor of 2**n if the image has no overviews. Adds a
+                standard error column '<band>_se' per band.
+            sample_pixels (int, optional): Estimate band means from about this
+                many pixels, read as randomly drawn internal blocks (one per
+                stratum of neighbouring blocks). Adds '<band>_se' and
+                '<band>_ci_low'/'<band>_ci_high' columns per band.
+            confidence (float): Confidence level of the sampling intervals
+            random_state (int, optional): Seed making the sampling reproducible
+            use_stored_stats (bool): Take exact band means from GDAL
+                statistics (STATISTICS_MEAN in the GeoTIFF tags or .aux.xml
+                sidecar) when present, so only the header is read.
+                Approximate statistics, and statistics of images with a
+                nodata value (which GDAL excludes from the mean), are
+                ignored.
+            validate_stored_stats (bool): Check stored means against a quick
+                overview estimate and fall back to reading the pixels if
+                they disagree
+            write_stats (bool): Write computed exact means to the .aux.xml
+                sidecar, so later runs can use them. Skipped for images with
+                a nodata value.
+            memmap (bool): Reduce uncompressed GeoTIFFs through a numpy
+                memory map of the file instead of decoding through GDAL.
+                Other layouts are read as usual.
+            start_date, end_date (str or datetime, optional): Only use scenes
+                acquired within this date range (inclusive), selected from
+                the image tags, filenames or catalog without reading pixels
+            bounds (tuple, optional): (left, bottom, right, top) area of
+                interest. Scenes not overlapping it are skipped by their
+                header, and band statistics only cover the pixels within it.
+            bounds_crs (str, optional): CRS of the bounds. Defaults to the
+                CRS of each image.
+            prefetch (int): Number of upcoming scenes a background thread
+                reads ahead (into the page cache) while the current one is
+                reduced or estimated. Disabled with 0. Only applies when
+                whole images are decoded, i.e. without use_stored_stats,
+                overview_level, sample_pixels or bounds.
+            shard (tuple, optional): (index, count) to only use the scenes of
+                one of count shards, e.g. for scheduler array jobs. Scenes
+                passing the filters are split by file size and a stable hash
+                of their file name, the same way in every job.
         """
+        if sum(bool(option) for option in (streaming, overview_level, sample_pixels)) > 1:
+            raise ValueError("streaming, overview_level and sample_pixels cannot be combined")
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError(f"Shard index must be in [0, {shard[1]}), got {shard[0]}")
+        
         self.data_dir = Path(data_dir)
+        self.streaming = streaming
+        self.max_workers = max_workers
+        self.overview_level = overview_level
+        self.sample_pixels = sample_pixels
+        self.confidence = confidence
+        self.random_state = random_state
+        self.use_stored_stats = use_stored_stats
+        self.validate_stored_stats = validate_stored_stats
+        self.write_stats = write_stats
+        self.memmap = memmap
+        self.start_date = pd.Timestamp(start_date).to_pydatetime() if start_date else None
+        self.end_date = pd.Timestamp(end_date).to_pydatetime() if end_date else None
+        self.bounds = tuple(bounds) if bounds is not None else None
+        self.bounds_crs = bounds_crs
+        self.prefetch = prefetch
+        self.shard = tuple(shard) if shard is not None else None
         
-    def load_time_series(self):
-        """Load time series data from drone imagery"""
-        # Get all tiff files
+        if catalog is True:
+            catalog = self.data_dir / CATALOG_NAME
+        self.catalog = SceneCatalog(catalog) if catalog else None
+        
+        # Band means of the last load, reused by later stages
+        self.time_series = None
+        # Digest of the scenes the last shard assignment was computed from
+        self.shard_digest = None
+        
+    def image_files(self):
+        """Get all tiff files in the data directory"""
         image_files = sorted(self.data_dir.glob('*.tif'))
         
         if not image_files:
             raise ValueError(f"No .tif files found in {self.data_dir}")
         
-        time_series = []
-        for img_file in image_files:
+        return image_files
+    
+    def load_time_series(self):
+        """Load time series data from drone imagery"""
+        scenes = self._select_scenes()
+        if not scenes:
+            raise ValueError(f"No images in {self.data_dir} match the date and bounds filters")
+        
+        time_series = [scene._band_stats for scene in scenes]
+        pending = [i for i, record in enumerate(time_series) if record is None]
+        pending_files = [scenes[i].path for i in pending]
+        
+        if self.max_workers and self.max_workers > 1:
+            # GDAL decoding and numpy reductions release the GIL
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                loaded = list(executor.map(self._load_scene, pending_files))
+        elif self._reads_ahead():
+            pending_scenes = prefetch_scenes([scenes[i] for i in pending], self.prefetch)
+            loaded = [self._load_scene(scene.path) for scene in pending_scenes]
+        else:
+            loaded = [self._load_scene(img_file) for img_file in pending_files]
+        
+        for i, record in zip(pending, loaded):
+            time_series[i] = record
+        if self.catalog is not None and loaded:
+            self.catalog.store_many(zip(pending_files, loaded), self._stats_mode())
+        
+        df = pd.DataFrame(time_series)
+        self.time_series = df.sort_values('date', kind='stable').reset_index(drop=True)
+        return self.time_series
+    
+    def load_zonal_time_series(self, plots, id_column=None, label_cache_dir=None):
+        """
+        Load per-plot band means for every image
+        
+        Args:
+            plots (gpd.GeoDataFrame or str): Plot polygons or a vector file
+            id_column (str, optional): Column holding the plot identifiers.
+                Defaults to the GeoDataFrame index.
+            label_cache_dir (str, optional): Directory caching the rasterized
+                plot label grids across runs
+            
+        Returns:
+            pd.DataFrame: One row per plot and date with 'plot_id', 'date',
+                the band means and 'pixel_count'. With a bounds filter, only
+                plot pixels within the bounds are counted.
+        """
+        from .zonal import ZonalStatistics
+        
+        zonal = ZonalStatistics(plots, id_column, cache_dir=label_cache_dir)
+        image_files = self.scene_paths()
+        if not image_files:
+            raise ValueError(f"No images in {self.data_dir} match the date and bounds filters")
+        
+        def load_scene(img_file):
             with rasterio.open(img_file) as src:
-                # Read metadata
-                date_str = src.tags().get('date')
-                if date_str:
-                    date = datetime.strptime(date_str, "%Y-%m-%d")
-                else:
-                    # Try to parse from filename
-                    date_str = img_file.stem.split('_')[-1]
-                    date = datetime.strptime(date_str, "%Y%m%d")
-                
-                # Read bands
-                blue = src.read(1)
-                green = src.read(2)
-                red = src.read(3)
-                nir = src.read(4)
-                red_edge = src.read(5)
-                
-                # Take mean values (assuming homogeneous field)
-                time_series.append({
-                    'date': date,
-                    'blue': float(np.mean(blue)),
-                    'green': float(np.mean(green)),
-                    'red': float(np.mean(red)),
-                    'nir': float(np.mean(nir)),
-                    'red_edge': float(np.mean(red_edge))
-                })
-        
-        return pd.DataFrame(time_series)
-    
-    def calculate_vegetation_indices(self):
-        """Calculate vegetation indices from drone imagery"""
-        df = self.load_time_series()
-        time_series_indices = []
-        
-        for _, row in df.iterrows():
-            # Calculate indices
-            indices = {
-                'NDVI': (row['nir'] - row['red']) / (row['nir'] + row['red']),
-                'NDRE': (row['nir'] - row['red_edge']) / (row['nir'] + row['red_edge']),
-                'SAVI': 1.5 * (row['nir'] - row['red']) / (row['nir'] + row['red'] + 0.5),
-                'GNDVI': (row['nir'] - row['green']) / (row['nir'] + row['green']),
-                'MCARI': ((row['red_edge'] - row['red']) - 0.2 * (row['red_edge'] - row['green'])) * (row['red_edge'] / row['red']),
-                'CIred-edge': (row['nir'] / row['red_edge']) - 1
-            }
-            
-            time_series_indices.append({
-                'date': row['date'],
-                'indices': indices
-            })
-        
-        return time_series_indices 
\ No newline at end of file
+                window = self.clip_window(src.crs, src.transform, src.height, src.width)
+                df = zonal.plot_means(src, window)
+                df.insert(1, 'date', parse_scene_date(src, img_file))
+            return df
+        
+        if self.max_workers and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                scenes = list(executor.map(load_scene, image_files))
+        else:
+            scenes = [load_scene(img_file) for img_file in image_files]
+        
+        df = pd.concat(scenes, ignore_index=True)
+        self.time_series = df.sort_values('date', kind='stable').reset_index(drop=True)
+        return self.time_series
+    
+    def _reads_ahead(self):
+        """
+        Whether prefetch applies
+        
+        Reading ahead pulls whole files, which only pays off when every pixel
+        is decoded anyway, not for stored statistics, overviews, sampled
+        blocks or reads clipped to bounds.
+        """
+        return bool(self.prefetch) and not (
+            self.use_stored_stats or self.overview_level or self.sample_pixels
+            or self.bounds is not None
+        )
+    
+    def _stats_mode(self):
+        """Name of the band reduction, used to key cached statistics"""
+        if self.overview_level:
+            mode = f'overview-{self.overview_level}'
+        elif self.sample_pixels:
+            mode = f'sample-{self.sample_pixels}-{self.random_state}-{self.confidence}'
+        elif self.use_stored_stats:
+            # Stored statistics may differ from the pixels, keep them apart
+            mode = 'mean-validated' if self.validate_stored_stats else 'mean-stored'
+        else:
+            mode = 'mean'
+        if self.bounds is not None:
+            mode += f'-bounds-{self.bounds}-{self.bounds_crs}'
+        return mode
+    
+    def clip_window(self, crs, transform, height, width):
+        """
+        Pixel window of an image grid covered by the bounds filter
+        
+        Args:
+            crs (rasterio.crs.CRS): Image CRS
+            transform (affine.Affine): Image transform
+            height, width (int): Image size
+            
+        Returns:
+            Window: Window of all pixels touching the bounds (empty if the
+                image does not overlap them), or None without a bounds filter
+        """
+        if self.bounds is None:
+            return None
+        
+        left, bottom, right, top = self.bounds
+        if self.bounds_crs is not None and crs is not None and crs != self.bounds_crs:
+            left, bottom, right, top = transform_bounds(self.bounds_crs, crs, left, bottom, right, top)
+        
+        window = rasterio.windows.from_bounds(left, bottom, right, top, transform=transform)
+        row_start = min(max(int(np.floor(window.row_off)), 0), height)
+        col_start = min(max(int(np.floor(window.col_off)), 0), width)
+        row_stop = min(max(int(np.ceil(window.row_off + window.height)), row_start), height)
+        col_stop = min(max(int(np.ceil(window.col_off + window.width)), col_start), width)
+        return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+    
+    def _selected(self, scene):
+        """Check the date and bounds filters from the scene header"""
+        if self.start_date is not None and scene.date < self.start_date:
+            return False
+        if self.end_date is not None and scene.date > self.end_date:
+            return False
+        if self.bounds is not None:
+            metadata = scene.metadata
+            window = self.clip_window(metadata['crs'], metadata['transform'],
+                                      metadata['height'], metadata['width'])
+            if window.width == 0 or window.height == 0:
+                return False
+        return True
+    
+    def iter_scenes(self):
+        """
+        Iterate over the images as lazily evaluated scenes in date order
+        
+        Only the image headers (or catalog entries) are read up front to
+        apply the date and bounds filters and sort the scenes by date. Band
+        statistics are computed when a scene's band_stats are first
+        accessed, so processing of early scenes can start before later ones
+        are read. With max_workers, a thread pool loads the band statistics
+        of the next scenes ahead of the consumer; otherwise, with prefetch,
+        upcoming images are read ahead on a background thread.
+        
+        Yields:
+            Scene: One scene per selected image, in date order
+        """
+        scenes = self._select_scenes()
+        if self.max_workers and self.max_workers > 1:
+            yield from load_scenes(scenes, self.max_workers)
+        elif self._reads_ahead():
+            yield from prefetch_scenes(scenes, self.prefetch)
+        else:
+            yield from scenes
+    
+    def scene_paths(self):
+        """
+        Paths of the images passing the filters (and in the shard), in date order
+        
+        Unlike iter_scenes, no band statistics are loaded and nothing is
+        read ahead; only the headers (or catalog entries) are read.
+        
+        Returns:
+            list: Image paths
+        """
+        return [scene.path for scene in self._select_scenes()]
+    
+    def _select_scenes(self):
+        """Scenes passing the date and bounds filters (and in the shard), sorted by date"""
+        scenes = [Scene(img_file, self) for img_file in self.image_files()]
+        if self.catalog is not None:
+            mode = self._stats_mode()
+            for scene in scenes:
+                record = self.catalog.lookup(scene.path, mode)
+                if record is not None:
+                    scene._date = record['date']
+                    scene._band_stats = record
+        
+        scenes = [scene for scene in scenes if self._selected(scene)]
+        if self.shard is not None:
+            index, count = self.shard
+            sizes = {scene.path.name: scene.path.stat().st_size for scene in scenes}
+            assignment = assign_shards(sizes, count)
+            self.shard_digest = scene_set_digest(sizes)
+            scenes = [scene for scene in scenes if assignment[scene.path.name] == index]
+        scenes.sort(key=lambda scene: scene.date)
+        return scenes
+    
+    def _scene_record(self, img_file):
+        """Band statistics of one image, from the catalog if possible"""
+        if self.catalog is None:
+            return self._load_scene(img_file)
+        
+        mode = self._stats_mode()
+        record = self.catalog.lookup(img_file, mode)
+        if record is None:
+            record = self._load_scene(img_file)
+            self.catalog.store(img_file, mode, record)
+        return record
+    
+    def _load_scene(self, img_file):
+        """Read the acquisition date and band means of a single image"""
+        with rasterio.open(img_file) as src:
+            date = parse_scene_date(src, img_file)
+            window = self.clip_window(src.crs, src.transform, src.height, src.width)
+            
+            if self.overview_level:
+                band_means = self._overview_band_means(src, self.overview_level, window)
+            elif self.sample_pixels:
+                band_means = self._sample_band_means(src, self.sample_pixels, self._scene_rng(img_file), window)
+            else:
+                # Stored statistics describe the whole image
+                band_means = None
+                if self.use_stored_stats and window is None:
+                    band_means = self._stored_band_means(src)
+                if band_means is None:
+                    if self.memmap:
+                        band_means = self._memmap_band_means(src, window)
+                    if band_means is None and self.streaming:
+                        band_means = self._stream_band_means(src, window)
+                    elif band_means is None:
+                        band_means = self._read_band_means(src, window)
+                    if self.write_stats and window is None and not has_nodata(src):
+                        write_stats_sidecar(img_file, band_means)
+            
+            band_means = scale_band_statistics(band_means, src)
+        
+        return {'date': date, **band_means}
+    
+    def _stored_band_means(self, src):
+        """
+        Get band means from stored GDAL statistics
+        
+        Args:
+            src (rasterio.DatasetReader): Open image
+            
+        Returns:
+            dict: Mean value per band, or None if not all bands have exact
+                stored statistics, the image has a nodata value or
+                validation failed
+        """
+        if has_nodata(src):
+            return None
+        
+        band_means = {}
+        for band, bidx in zip(BANDS, BAND_INDEXES):
+            tags = src.tags(bidx)
+            if 'STATISTICS_MEAN' not in tags or tags.get('STATISTICS_APPROXIMATE') == 'YES':
+                return None
+            band_means[band] = float(tags['STATISTICS_MEAN'])
+        
+        if self.validate_stored_stats:
+            approx = self._overview_band_means(src, 3)
+            for band in BANDS:
+                tolerance = 4 * approx[f'{band}_se'] + 1e-6 * abs(approx[band])
+                if not abs(band_means[band] - approx[band]) <= tolerance:
+                    return None
+        
+        return band_means
+    
+    @staticmethod
+    def _memmap_band_means(src, window=None):
+        """
+        Take mean values over a memory map of the pixel data
+        
+        Args:
+            src (rasterio.DatasetReader): Open image
+            window (Window, optional): Pixels to reduce, the whole image if None
+            
+        Returns:
+            dict: Mean value per band, or None if the layout cannot be mapped
+        """
+        mapped = MemmapRaster.open(src)
+        if mapped is None:
+            return None
+        
+        sums = mapped.band_sums(BAND_INDEXES, window)
+        if window is None:
+            count = src.height * src.width
+        else:
+            count = int(window.height) * int(window.width)
+        return {band: total.item() / count for band, total in zip(BANDS, sums)}
+    
+    @staticmethod
+    def _read_band_means(src, window=None):
+        """
+        Take mean values of whole bands (assuming homogeneous field)
+        
+        Pixel-interleaved images store all bands in the same blocks, so they
+        are read in one call that decodes every block once. Band-interleaved
+        images are read band by band to keep a single band in memory.
+        
+        Args:
+            src (rasterio.DatasetReader): Open image
+            window (Window, optional): Pixels to reduce, the whole image if None
+            
+        Returns:
+            dict: Mean value per band
+        """
+        if window is None:
+            count = src.height * src.width
+        else:
+            count = int(window.height) * int(window.width)
+        if is_pixel_interleaved(src):
+            sums = pixel_sums(src.read(BAND_INDEXES, window=window), axis=(1, 2))
+        else:
+            sums = [pixel_sums(src.read(bidx, window=window)) for bidx in BAND_INDEXES]
+        
+        return {band: total.item() / count for band, total in zip(BANDS, sums)}
+    
+    @staticmethod
+    def _stream_band_means(src, window=None):
+        """
+        Take mean values by accumulating running sums over the internal
+        block windows of the GeoTIFF
+        
+        Args:
+            src (rasterio.DatasetReader): Open image
+            window (Window, optional): Pixels to reduce, the whole image if None
+            
+        Returns:
+            dict: Mean value per band
+        """
+        sums = 0
+        count = 0
+        
+        for block_window in block_windows(src, window):
+            block = src.read(BAND_INDEXES, window=block_window)
+            sums = sums + pixel_sums(block, axis=(1, 2))
+            count += block.shape[1] * block.shape[2]
+        
+        return {band: total.item() / count for band, total in zip(BANDS, sums)}
+    
+    @staticmethod
+    def _overview_band_means(src, level, window=None):
+        """
+        Approximate mean values from a reduced resolution read
+        
+        GDAL serves the read from the closest overview if the image has
+        overviews, otherwise the bands are decimated with average resampling.
+        The reported error treats the reduced pixels as a sample of the
+        scene, which is conservative for averaged overviews.
+        
+        Args:
+            src (rasterio.DatasetReader): Open image
+            level (int): Overview level (1 = first overview)
+            window (Window, optional): Pixels to reduce, the whole image if None
+            
+        Returns:
+            dict: Mean value and standard error ('<band>_se') per band
+        """
+        overviews = src.overviews(1)
+        if overviews:
+            factor = overviews[min(level, len(overviews)) - 1]
+        else:
+            factor = 2 ** level
+        
+        height, width = (src.height, src.width) if window is None else \
+            (int(window.height), int(window.width))
+        out_shape = (
+            len(BANDS),
+            max(1, -(-height // factor)),
+            max(1, -(-width // factor))
+        )
+        data = src.read(BAND_INDEXES, window=window, out_shape=out_shape,
+                        resampling=Resampling.average)
+        data = data.reshape(len(BANDS), -1)
+        n_pixels = data.shape[1]
+        
+        means = data.mean(axis=1, dtype=np.float64)
+        if n_pixels > 1:
+            errors = data.std(axis=1, dtype=np.float64, ddof=1) / np.sqrt(n_pixels)
+        else:
+            errors = np.full(len(BANDS), np.nan)
+        
+        band_means = {band: float(mean) for band, mean in zip(BANDS, means)}
+        band_means.update({f'{band}_se': float(error) for band, error in zip(BANDS, errors)})
+        return band_means
+    
+    def _scene_rng(self, img_file):
+        """Random generator of a scene, independent of the loading order"""
+        if self.random_state is None:
+            return np.random.default_rng()
+        return np.random.default_rng([self.random_state, zlib.crc32(Path(img_file).name.encode())])
+    
+    def _sample_band_means(self, src, sample_pixels, rng, window=None):
+        """
+        Estimate mean values from block-stratified random windows
+        
+        The internal blocks are split into as many strata of neighbouring
+        blocks as needed to cover sample_pixels, and one block is drawn at
+        random from every stratum. Means use the ratio estimator (blocks at
+        the image edges are smaller), standard errors include the finite
+        population correction and intervals use Student's t distribution.
+        
+        Args:
+            src (rasterio.DatasetReader): Open image
+            sample_pixels (int): Approximate number of pixels to read
+            rng (np.random.Generator): Random generator
+            window (Window, optional): Pixels to sample from, the whole image
+                if None
+            
+        Returns:
+            dict: Mean value, standard error and confidence interval per band
+        """
+        windows = block_windows(src, window)
+        block_height, block_width = src.block_shapes[0]
+        n_blocks = len(windows)
+        n_sampled = min(n_blocks, max(1, -(-sample_pixels // (block_height * block_width))))
+        
+        strata = np.array_split(np.arange(n_blocks), n_sampled)
+        sampled = [windows[rng.choice(stratum)] for stratum in strata]
+        
+        sums = np.empty((n_sampled, len(BANDS)))
+        counts = np.empty(n_sampled)
+        for i, block_window in enumerate(sampled):
+            block = src.read(BAND_INDEXES, window=block_window)
+            sums[i] = block.sum(axis=(1, 2), dtype=np.float64)
+            counts[i] = block.shape[1] * block.shape[2]
+        
+        means = sums.sum(axis=0) / counts.sum()
+        if n_sampled == n_blocks:
+            errors = np.zeros(len(BANDS))
+        elif n_sampled == 1:
+            errors = np.full(len(BANDS), np.nan)
+        else:
+            residuals = sums - np.outer(counts, means)
+            variance = (residuals ** 2).sum(axis=0) / (n_sampled - 1)
+            fpc = 1 - n_sampled / n_blocks
+            errors = np.sqrt(fpc * variance / n_sampled) / counts.mean()
+        
+        # Few sampled blocks give a noisy variance estimate, so the interval
+        # uses the t distribution with one degree of freedom less
+        z = stats.t.ppf(0.5 + self.confidence / 2, max(n_sampled - 1, 1))
+        band_means = {}
+        for band, mean, error in zip(BANDS, means, errors):
+            band_means[band] = float(mean)
+            band_means[f'{band}_se'] = float(error)
+            band_means[f'{band}_ci_low'] = float(mean - z * error)
+            band_means[f'{band}_ci_high'] = float(mean + z * error)
+        return band_means
+    
+    def calculate_vegetation_indices_frame(self, time_series=None):
+        """
+        Calculate vegetation indices for all rows at once
+        
+        Args:
+            time_series (pd.DataFrame, optional): Band means as returned by
+                load_time_series. Defaults to the result of the last load;
+                images are only read if nothing has been loaded yet.
+            
+        Returns:
+            pd.DataFrame: Identifying columns of the time series ('date' and,
+                for zonal loads, 'plot_id') and one column per vegetation index.
+                If the band means carry standard errors (approximate or
+                sampled loads), '<index>_se' columns hold the propagated errors.
+        """
+        if time_series is None:
+            time_series = self.time_series
+        if time_series is None:
+            time_series = self.load_time_series()
+        
+        indices = compute_vegetation_indices(time_series)
+        id_columns = [col for col in ('plot_id', 'date') if col in time_series.columns]
+        df = time_series[id_columns].copy()
+        for name in INDEX_NAMES:
+            df[name] = indices[name]
+        
+        band_errors = {band: time_series[f'{band}_se'] for band in BANDS
+                       if f'{band}_se' in time_series.columns}
+        if band_errors:
+            index_errors = propagate_index_errors(time_series, band_errors)
+            for name in INDEX_NAMES:
+                df[f'{name}_se'] = index_errors[name]
+        return df
+    
+    def calculate_vegetation_indices(self, time_series=None):
+        """
+        Calculate vegetation indices from drone imagery
+        
+        Compatibility view of calculate_vegetation_indices_frame.
+        
+        Args:
+            time_series (pd.DataFrame, optional): Band means as returned by
+                load_time_series. Defaults to the result of the last load;
+                images are only read if nothing has been loaded yet.
+            
+        Returns:
+            list: List of dictionaries containing indices per timestamp
+        """
+        return indices_to_records(self.calculate_vegetation_indices_frame(time_series))
\ No newline at end of file
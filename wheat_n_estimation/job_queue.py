@@ -0,0 +1,260 @@
+"""Shared SQLite job queue with leases for multi-node batch runs."""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Delay before retrying a lease renewal that failed, e.g. on a locked database
+RENEW_RETRY_SECONDS = 5
+
+def default_worker_id():
+    """Worker identifier unique across the nodes sharing a queue"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class JobQueue:
+    """
+    SQLite queue of named jobs claimed atomically under time-limited leases.
+
+    Any number of worker processes, on any node that mounts the database,
+    can claim jobs. A claim holds a lease that the worker renews while it
+    runs the job; jobs of crashed workers become claimable again once their
+    lease expires. Completed jobs stay recorded, so re-adding the same jobs
+    and restarting the workers resumes an interrupted run without redoing
+    finished work.
+
+    The database uses SQLite's rollback journal (not WAL, which needs shared
+    memory that network filesystems do not provide), and every claim runs in
+    an immediate transaction, so claims are serialized by the file lock.
+    Read-only queries use deferred transactions and only take a shared lock.
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        """
+        Initialize the queue
+
+        Args:
+            path (str): Path of the SQLite database, created if missing
+            lease_seconds (float): Time a claim stays valid without renewal
+            max_attempts (int): Claims per job before it is marked failed
+                (a job whose worker keeps crashing is not retried forever)
+        """
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    name TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    error TEXT,
+                    updated REAL NOT NULL
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self, write=True):
+        """
+        Open a connection that commits on success and is always closed
+
+        Args:
+            write (bool): Take the write lock up front (immediate
+                transaction); read-only queries use a deferred transaction
+        """
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def add(self, jobs):
+        """
+        Add jobs, keeping the state of jobs that already exist
+
+        Args:
+            jobs (dict): Job payloads (JSON serializable) keyed by job name
+
+        Returns:
+            int: Number of new jobs
+        """
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (name, payload, status, updated) VALUES (?, ?, ?, ?)",
+                [(name, json.dumps(payload), PENDING, now) for name, payload in jobs.items()]
+            )
+            return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - before
+
+    def claim(self, worker):
+        """
+        Claim the next pending job or a job whose lease has expired
+
+        Args:
+            worker (str): Identifier of the claiming worker
+
+        Returns:
+            dict: Job with 'name', 'payload' and 'attempts', or None if no
+                job is claimable right now
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # Give up on jobs whose workers died too often
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, 'LeaseExpired: worker stopped without reporting', now,
+                 RUNNING, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT name, payload, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY attempts, name LIMIT 1",
+                (PENDING, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+
+            name, payload, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE name = ?",
+                (RUNNING, worker, now + self.lease_seconds, now, name)
+            )
+        return {'name': name, 'payload': json.loads(payload), 'attempts': attempts + 1}
+
+    def renew(self, name, worker):
+        """
+        Extend the lease of a claimed job
+
+        Returns:
+            bool: False if the job is no longer held by this worker
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? "
+                "WHERE name = ? AND worker = ? AND status = ?",
+                (now + self.lease_seconds, now, name, worker, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    @contextmanager
+    def heartbeat(self, name, worker):
+        """Renew the lease of a job in a background thread while it runs"""
+        stop = threading.Event()
+
+        def renew():
+            interval = self.lease_seconds / 3
+            while not stop.wait(interval):
+                try:
+                    if not self.renew(name, worker):
+                        return
+                    interval = self.lease_seconds / 3
+                except sqlite3.OperationalError as e:
+                    # Keep trying while the lease is still valid, e.g. when the
+                    # database stayed locked past the connection timeout
+                    print(f"Warning: Could not renew the lease of {name}: {e}")
+                    interval = min(self.lease_seconds / 3, RENEW_RETRY_SECONDS)
+
+        thread = threading.Thread(target=renew, name='job-heartbeat', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, name, worker):
+        """Mark a claimed job as done"""
+        self._finish(name, worker, DONE, None)
+
+    def fail(self, name, worker, error):
+        """Mark a claimed job as failed with an error message"""
+        self._finish(name, worker, FAILED, error)
+
+    def _finish(self, name, worker, status, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated = ? "
+                "WHERE name = ? AND worker = ?",
+                (status, error, time.time(), name, worker)
+            )
+
+    def retry_failed(self):
+        """
+        Make failed jobs claimable again with a fresh attempt count
+
+        Returns:
+            int: Number of jobs reset
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, worker = NULL, error = NULL, "
+                "updated = ? WHERE status = ?",
+                (PENDING, time.time(), FAILED)
+            )
+            return cursor.rowcount
+
+    def next_expiry(self):
+        """
+        Earliest lease expiry of running jobs
+
+        Returns:
+            float: Unix time, or None if no job is running
+        """
+        with self._connect(write=False) as conn:
+            return conn.execute(
+                "SELECT MIN(lease_expires) FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchone()[0]
+
+    def jobs(self, status=None):
+        """
+        List jobs
+
+        Args:
+            status (str, optional): Only jobs in this state
+
+        Returns:
+            list: Dicts with 'name', 'payload', 'status', 'attempts',
+                'worker' and 'error', ordered by name
+        """
+        query = "SELECT name, payload, status, attempts, worker, error FROM jobs"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._connect(write=False) as conn:
+            rows = conn.execute(query + " ORDER BY name", params).fetchall()
+        return [
+            {'name': name, 'payload': json.loads(payload), 'status': status,
+             'attempts': attempts, 'worker': worker, 'error': error}
+            for name, payload, status, attempts, worker, error in rows
+        ]
+
+    def counts(self):
+        """Number of jobs per state"""
+        with self._connect(write=False) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (PENDING, RUNNING, DONE, FAILED)} | dict(rows)
@@ -0,0 +1,206 @@
+"""Zero-copy access to uncompressed GeoTIFFs through numpy memory maps."""
+
+import numpy as np
+
+class MemmapRaster:
+    """
+    Bands of an uncompressed GeoTIFF as strided views over a memory map.
+
+    Supports striped and tiled layouts with pixel or band interleaving, as
+    long as the blocks of every band are stored contiguously in block order
+    (as GDAL writes them). Pixel data is never copied: block reads return
+    views into the mapped file, and reductions stream through the page cache.
+    """
+
+    def __init__(self, path, view, shape, block_shape, tiled):
+        """
+        Use MemmapRaster.open to detect a supported layout.
+
+        Args:
+            path (str): Path of the image
+            view (np.ndarray): Strided view of shape (count, rows, cols) for
+                striped layouts or (count, tile_rows, tile_cols, block_height,
+                block_width) for tiled layouts
+            shape (tuple): Image (height, width)
+            block_shape (tuple): Internal block (height, width)
+            tiled (bool): Whether the image is tiled
+        """
+        self.path = path
+        self.view = view
+        self.shape = shape
+        self.block_shape = block_shape
+        self.tiled = tiled
+
+    @classmethod
+    def open(cls, src):
+        """
+        Map the pixel data of an open image
+
+        Args:
+            src (rasterio.DatasetReader): Open image
+
+        Returns:
+            MemmapRaster: Mapped image, or None if the layout is compressed,
+                bit-packed, sparse or otherwise not contiguous
+        """
+        if src.driver != 'GTiff' or src.compression is not None:
+            return None
+        if len(set(src.dtypes)) != 1 or src.tags(ns='IMAGE_STRUCTURE').get('NBITS'):
+            return None
+
+        with open(src.name, 'rb') as f:
+            byte_order = {b'II': '<', b'MM': '>'}.get(f.read(2))
+        if byte_order is None:
+            return None
+        dtype = np.dtype(src.dtypes[0]).newbyteorder(byte_order)
+        itemsize = dtype.itemsize
+
+        height, width = src.shape
+        block_height, block_width = src.block_shapes[0]
+        tiled = block_width != width
+        blocks_y = -(-height // block_height)
+        blocks_x = -(-width // block_width) if tiled else 1
+        pixel_interleaved = src.count > 1 and src.interleaving is not None and \
+            src.interleaving.name == 'pixel'
+
+        samples = src.count if pixel_interleaved else 1
+        block_bytes = block_height * block_width * samples * itemsize
+        band_offsets = []
+        for bidx in (range(1, 2) if pixel_interleaved else src.indexes):
+            offsets = [
+                src.get_tag_item(f'BLOCK_OFFSET_{x}_{y}', 'TIFF', bidx=bidx)
+                for y in range(blocks_y) for x in range(blocks_x)
+            ]
+            if any(offset is None for offset in offsets):
+                return None
+            offsets = [int(offset) for offset in offsets]
+            if offsets[0] == 0 or any(
+                offset != offsets[0] + k * block_bytes for k, offset in enumerate(offsets)
+            ):
+                return None
+            band_offsets.append(offsets[0])
+
+        # Band strides must be uniform to address all bands with one view
+        if pixel_interleaved:
+            offset, band_stride = band_offsets[0], itemsize
+        else:
+            offset = band_offsets[0]
+            band_stride = band_offsets[1] - band_offsets[0] if len(band_offsets) > 1 else 0
+            if any(b - a != band_stride for a, b in zip(band_offsets, band_offsets[1:])):
+                return None
+            if band_stride < 0:
+                return None
+
+        pixel_stride = samples * itemsize
+        mapped = np.memmap(src.name, dtype=np.uint8, mode='r')
+        if tiled:
+            view_shape = (src.count, blocks_y, blocks_x, block_height, block_width)
+            strides = (band_stride, blocks_x * block_bytes, block_bytes,
+                       block_width * pixel_stride, pixel_stride)
+        else:
+            view_shape = (src.count, height, width)
+            strides = (band_stride, width * pixel_stride, pixel_stride)
+        extent = offset + itemsize + sum((n - 1) * stride for n, stride in zip(view_shape, strides))
+        if extent > mapped.size:
+            return None
+
+        view = np.ndarray(view_shape, dtype=dtype, buffer=mapped, offset=offset, strides=strides)
+        return cls(src.name, view, (height, width), (block_height, block_width), tiled)
+
+    def _band_slice(self, indexes):
+        """Basic slice selecting 1-based band indexes without copying"""
+        positions = [bidx - 1 for bidx in indexes]
+        step = positions[1] - positions[0] if len(positions) > 1 else 1
+        if step > 0 and positions == list(range(positions[0], positions[-1] + 1, step)):
+            return slice(positions[0], positions[-1] + 1, step)
+        return positions
+
+    def read(self, indexes, window):
+        """
+        Read bands within a window
+
+        Args:
+            indexes (list): 1-based band indexes
+            window (rasterio.windows.Window): Window to read. Striped images
+                give views for any window, tiled images for windows within a
+                single block; other windows are assembled into a new array.
+
+        Returns:
+            np.ndarray: Array of shape (len(indexes), rows, cols)
+        """
+        bands = self._band_slice(indexes)
+        row_off, col_off = int(window.row_off), int(window.col_off)
+        rows, cols = int(window.height), int(window.width)
+
+        if not self.tiled:
+            return self.view[bands, row_off:row_off + rows, col_off:col_off + cols]
+
+        block_height, block_width = self.block_shape
+        ty, y0 = divmod(row_off, block_height)
+        tx, x0 = divmod(col_off, block_width)
+        if y0 + rows <= block_height and x0 + cols <= block_width:
+            return self.view[bands, ty, tx, y0:y0 + rows, x0:x0 + cols]
+
+        out = np.empty((len(indexes), rows, cols), dtype=self.view.dtype.newbyteorder('='))
+        row = row_off
+        while row < row_off + rows:
+            ty, y0 = divmod(row, block_height)
+            y1 = min(block_height, y0 + row_off + rows - row)
+            col = col_off
+            while col < col_off + cols:
+                tx, x0 = divmod(col, block_width)
+                x1 = min(block_width, x0 + col_off + cols - col)
+                out[:, row - row_off:row - row_off + y1 - y0, col - col_off:col - col_off + x1 - x0] = \
+                    self.view[bands, ty, tx, y0:y1, x0:x1]
+                col += x1 - x0
+            row += y1 - y0
+        return out
+
+    def band_sums(self, indexes, window=None):
+        """
+        Sum bands over the whole image or a window, without copying pixels
+
+        Args:
+            indexes (list): 1-based band indexes
+            window (rasterio.windows.Window, optional): Pixels to sum, the
+                whole image if None. Tiled images are summed tile by tile
+                over views of the tiles intersecting the window.
+
+        Returns:
+            np.ndarray: Sum per band, exact int64 for integer images and
+                float64 otherwise
+        """
+        bands = self._band_slice(indexes)
+        dtype = np.int64 if np.issubdtype(self.view.dtype, np.integer) else np.float64
+        if window is not None:
+            row_off, col_off = int(window.row_off), int(window.col_off)
+            row_end, col_end = row_off + int(window.height), col_off + int(window.width)
+            if not self.tiled:
+                return self.view[bands, row_off:row_end, col_off:col_end].sum(axis=(1, 2), dtype=dtype)
+
+            block_height, block_width = self.block_shape
+            sums = np.zeros(len(indexes), dtype=dtype)
+            for ty in range(row_off // block_height, -(-row_end // block_height)):
+                y0 = max(row_off - ty * block_height, 0)
+                y1 = min(row_end - ty * block_height, block_height)
+                for tx in range(col_off // block_width, -(-col_end // block_width)):
+                    x0 = max(col_off - tx * block_width, 0)
+                    x1 = min(col_end - tx * block_width, block_width)
+                    sums += self.view[bands, ty, tx, y0:y1, x0:x1].sum(axis=(1, 2), dtype=dtype)
+            return sums
+
+        if not self.tiled:
+            return self.view[bands].sum(axis=(1, 2), dtype=dtype)
+
+        # Skip the padding of the tiles at the right and bottom edges
+        height, width = self.shape
+        block_height, block_width = self.block_shape
+        full_x, last_width = divmod(width, block_width)
+        sums = np.zeros(len(indexes), dtype=dtype)
+        for ty in range(self.view.shape[1]):
+            rows = min(block_height, height - ty * block_height)
+            tiles = self.view[bands, ty]
+            sums += tiles[:, :full_x, :rows, :].sum(axis=(1, 2, 3), dtype=dtype)
+            if last_width:
+                sums += tiles[:, full_x, :rows, :last_width].sum(axis=(1, 2), dtype=dtype)
+        return sums
@@ -1,7 +1,210 @@
+import re
 import numpy as np
+import pandas as pd
 from sklearn.preprocessing import StandardScaler
 import joblib
 
+try:
+    import numexpr
+except ImportError:  # optional, accelerates the fused per-pixel kernel
+    numexpr = None
+
+# Validated regression equations: index -> (slope, intercept, R², RMSE)
+ESTIMATION_METHODS = {
+    'NDRE': (4.14, 0.42, 0.89, 0.31),        # Li et al. (2018)
+    'CIred-edge': (2.88, 0.97, 0.87, 0.34),  # Cao et al. (2020)
+    'MCARI': (3.52, 1.12, 0.83, 0.39)        # Prey & Schmidhalter (2019)
+}
+
+# Index formulas as numexpr expressions over the band arrays
+INDEX_EXPRESSIONS = {
+    'NDVI': '((nir - red) / (nir + red))',
+    'NDRE': '((nir - red_edge) / (nir + red_edge))',
+    'SAVI': '(1.5 * (nir - red) / (nir + red + 0.5))',
+    'GNDVI': '((nir - green) / (nir + green))',
+    'MCARI': '(((red_edge - red) - 0.2 * (red_edge - green)) * (red_edge / red))',
+    'CIred-edge': '(nir / red_edge - 1)'
+}
+
+def _ensemble_expressions():
+    """Build numexpr expressions for the masked, R²-weighted ensemble"""
+    weighted, weight_sum, rmse_sq, count = [], [], [], []
+    for name, (slope, intercept, r2, rmse) in ESTIMATION_METHODS.items():
+        index = INDEX_EXPRESSIONS[name]
+        valid = f'(abs({index}) < inf)'
+        weighted.append(f'where({valid}, ({slope} * {index} + {intercept}) * {r2}, 0.0)')
+        weight_sum.append(f'where({valid}, {r2}, 0.0)')
+        rmse_sq.append(f'where({valid}, {rmse**2}, 0.0)')
+        count.append(f'where({valid}, 1.0, 0.0)')
+
+    savi = INDEX_EXPRESSIONS['SAVI']
+    savi_correction = f'where({savi} < 0.2, 0.85, where({savi} > 0.7, 1.12, 1.0))'
+    n_content = f"({' + '.join(weighted)}) / ({' + '.join(weight_sum)}) * {savi_correction}"
+    rmse = f"sqrt(({' + '.join(rmse_sq)}) / ({' + '.join(count)}))"
+    return n_content, rmse
+
+N_CONTENT_EXPRESSION, RMSE_EXPRESSION = _ensemble_expressions()
+
+# Float literals, which numexpr would evaluate in float64 even for float32 arrays
+FLOAT_LITERAL = re.compile(r'(?<![\w.])(?:\d+\.\d*(?:e[-+]?\d+)?|\d+e[-+]?\d+)')
+
+def _lift_constants(expressions):
+    """Replace float literals by named constants that are cast to the array dtype"""
+    constants = {}
+
+    def constant_name(match):
+        return constants.setdefault(float(match.group()), f'const_{len(constants)}')
+
+    lifted = {key: FLOAT_LITERAL.sub(constant_name, expression) for key, expression in expressions.items()}
+    return lifted, {name: value for value, name in constants.items()}
+
+NUMEXPR_PROGRAMS, NUMEXPR_CONSTANTS = _lift_constants({
+    'n_content': N_CONTENT_EXPRESSION, 'rmse': RMSE_EXPRESSION, **INDEX_EXPRESSIONS
+})
+
+def _fused_numexpr(bands, include_indices, dtype):
+    """Evaluate the whole estimation per pixel in single numexpr passes"""
+    local_dict = {**bands, 'inf': dtype.type(np.inf)}
+    local_dict.update((name, dtype.type(value)) for name, value in NUMEXPR_CONSTANTS.items())
+    results = {
+        'n_content': numexpr.evaluate(NUMEXPR_PROGRAMS['n_content'], local_dict=local_dict),
+        'rmse': numexpr.evaluate(NUMEXPR_PROGRAMS['rmse'], local_dict=local_dict)
+    }
+    np.clip(results['n_content'], 1.5, 6.0, out=results['n_content'])
+
+    if include_indices:
+        for name in INDEX_EXPRESSIONS:
+            results[name] = numexpr.evaluate(NUMEXPR_PROGRAMS[name], local_dict=local_dict)
+    return results
+
+def _index_into(name, bands, out, work):
+    """Evaluate one vegetation index into a preallocated array"""
+    green, red, nir, red_edge = (bands[band] for band in ('green', 'red', 'nir', 'red_edge'))
+    if name == 'NDVI':
+        np.subtract(nir, red, out=out)
+        np.divide(out, np.add(nir, red, out=work), out=out)
+    elif name == 'NDRE':
+        np.subtract(nir, red_edge, out=out)
+        np.divide(out, np.add(nir, red_edge, out=work), out=out)
+    elif name == 'SAVI':
+        np.subtract(nir, red, out=out)
+        out *= 1.5
+        np.add(nir, red, out=work)
+        work += 0.5
+        out /= work
+    elif name == 'GNDVI':
+        np.subtract(nir, green, out=out)
+        np.divide(out, np.add(nir, green, out=work), out=out)
+    elif name == 'MCARI':
+        np.subtract(red_edge, red, out=out)
+        np.subtract(red_edge, green, out=work)
+        work *= 0.2
+        out -= work
+        out *= np.divide(red_edge, red, out=work)
+    elif name == 'CIred-edge':
+        np.divide(nir, red_edge, out=out)
+        out -= 1
+    return out
+
+def _fused_numpy(bands, include_indices, dtype):
+    """Pure numpy fallback reusing a fixed set of work arrays"""
+    shape = np.broadcast_shapes(*(array.shape for array in bands.values()))
+
+    index = np.empty(shape, dtype=dtype)
+    work = np.empty(shape, dtype=dtype)
+    mask = np.empty(shape, dtype=bool)
+    n_content = np.zeros(shape, dtype=dtype)
+    weight_sum = np.zeros(shape, dtype=dtype)
+    rmse_sq = np.zeros(shape, dtype=dtype)
+    count = np.zeros(shape, dtype=dtype)
+    results = {}
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if include_indices:
+            for name in INDEX_EXPRESSIONS:
+                results[name] = _index_into(name, bands, np.empty(shape, dtype=dtype), work)
+
+        for name, (slope, intercept, r2, rmse) in ESTIMATION_METHODS.items():
+            values = results.get(name)
+            if values is None:
+                values = _index_into(name, bands, index, work)
+            np.isfinite(values, out=mask)
+            np.multiply(values, slope, out=index)
+            index += intercept
+            index *= r2
+            np.add(n_content, index, out=n_content, where=mask)
+            np.add(weight_sum, r2, out=weight_sum, where=mask)
+            np.add(rmse_sq, rmse**2, out=rmse_sq, where=mask)
+            np.add(count, 1.0, out=count, where=mask)
+
+        n_content /= weight_sum
+        savi = results.get('SAVI')
+        if savi is None:
+            savi = _index_into('SAVI', bands, index, work)
+        np.multiply(n_content, 0.85, out=n_content, where=savi < 0.2)
+        np.multiply(n_content, 1.12, out=n_content, where=savi > 0.7)
+        np.clip(n_content, 1.5, 6.0, out=n_content)
+
+        rmse_sq /= count
+        np.sqrt(rmse_sq, out=rmse_sq)
+
+    results['n_content'] = n_content
+    results['rmse'] = rmse_sq
+    return results
+
+def compute_dtype(dtype):
+    """
+    Validate a floating point precision for per-pixel arithmetic
+
+    Args:
+        dtype (str or np.dtype): 'float32' or 'float64'
+
+    Returns:
+        np.dtype: The validated dtype
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"Unsupported compute dtype {dtype}, use float32 or float64")
+    return dtype
+
+def fused_pixel_estimate(blue, green, red, nir, red_edge, include_indices=False,
+                         use_numexpr=None, dtype=np.float64):
+    """
+    Compute vegetation indices and the N content ensemble per pixel in one pass
+
+    Gives the same results as compute_vegetation_indices followed by
+    NitrogenEstimator.estimate_n_content_arrays without materializing the
+    intermediate index and per-method estimate arrays. Uses numexpr when it
+    is installed and falls back to in-place numpy operations otherwise.
+
+    Args:
+        blue, green, red, nir, red_edge (np.ndarray): Reflectance tiles
+        include_indices (bool): Also return the six vegetation indices
+        use_numexpr (bool, optional): Force or disable numexpr. Defaults to
+            using it when available.
+        dtype (str or np.dtype): Precision of the arithmetic and the
+            results, float64 or float32 (half the memory traffic)
+
+    Returns:
+        dict: 'n_content' and 'rmse' arrays (NaN where no estimate is
+            possible), plus one array per index if requested
+    """
+    if use_numexpr is None:
+        use_numexpr = numexpr is not None
+    if use_numexpr and numexpr is None:
+        raise ValueError("numexpr is not installed")
+    dtype = compute_dtype(dtype)
+
+    bands = {
+        'green': np.asarray(green, dtype=dtype),
+        'red': np.asarray(red, dtype=dtype),
+        'nir': np.asarray(nir, dtype=dtype),
+        'red_edge': np.asarray(red_edge, dtype=dtype)
+    }
+    if use_numexpr:
+        return _fused_numexpr(bands, include_indices, dtype)
+    return _fused_numpy(bands, include_indices, dtype)
+
 class NitrogenEstimator:
     """
     Estimator for above-ground nitrogen content in winter wheat using vegetation indices.
@@ -99,15 +302,25 @@ class NitrogenEstimator:
             # Calculate uncertainty metrics
             rmse_weighted = np.sqrt(np.mean([ci['rmse']**2 for ci in confidence_intervals.values()]))
             r2_mean = np.mean([ci['r2'] for ci in confidence_intervals.values()])
+            uncertainty = {
+                'rmse': rmse_weighted,
+                'r2_mean': r2_mean,
+                'sample_size': len(n_estimates)
+            }
+            
+            # Add the error of sampled or approximate band means, if given
+            if any(f'{name}_se' in indices for name, _, _ in n_estimates):
+                sampling_error = savi_correction * sum(
+                    weight * abs(ESTIMATION_METHODS[name][0]) * indices.get(f'{name}_se', 0.0)
+                    for name, _, weight in n_estimates
+                ) / total_weight
+                uncertainty['sampling_error'] = sampling_error
+                uncertainty['total_error'] = np.sqrt(rmse_weighted**2 + sampling_error**2)
             
             return {
                 'n_content': n_content,
                 'confidence_intervals': confidence_intervals,
-                'uncertainty': {
-                    'rmse': rmse_weighted,
-                    'r2_mean': r2_mean,
-                    'sample_size': len(n_estimates)
-                },
+                'uncertainty': uncertainty,
                 'method_weights': {name: weight/total_weight for name, _, weight in n_estimates}
             }
         else:
@@ -136,6 +349,195 @@ class NitrogenEstimator:
         
         return predictions
     
+    def estimate_n_content_arrays(self, indices, dtype=np.float64):
+        """
+        Estimate N content for arrays of vegetation indices at once
+        
+        Same equations, R²-weighted ensemble, SAVI correction and clipping as
+        estimate_n_content_from_indices, applied element-wise. Missing or
+        non-finite index values are masked out of the ensemble instead of
+        raising.
+        
+        Standard errors of the indices ('<index>_se', e.g. from sampled
+        band means) are propagated through the ensemble as 'sampling_error',
+        assuming fully correlated index errors, and combined with the model
+        RMSE as 'total_error'. An unknown (NaN) standard error of a valid
+        index makes both NaN, as in estimate_n_content_from_indices.
+        
+        Args:
+            indices (dict or pd.DataFrame): Index arrays (or columns) keyed by
+                index name, all of the same shape
+            dtype (str or np.dtype): Precision of the arithmetic and the
+                results, float64 or float32
+            
+        Returns:
+            dict: Arrays keyed by 'n_content', 'rmse', 'r2_mean',
+                'sample_size', 'valid' and, per available method,
+                '<method>_estimate' and '<method>_weight'. Elements without
+                any valid index have NaN estimates and valid=False.
+        """
+        available = [name for name in ESTIMATION_METHODS if name in indices]
+        if not available:
+            raise ValueError("No valid indices available for N content estimation")
+        shape = np.shape(indices[available[0]])
+        dtype = compute_dtype(dtype)
+        
+        weight_sum = np.zeros(shape, dtype=dtype)
+        weighted_n = np.zeros(shape, dtype=dtype)
+        rmse_sq_sum = np.zeros(shape, dtype=dtype)
+        sample_size = np.zeros(shape, dtype=np.int64)
+        sampling_sum = np.zeros(shape, dtype=dtype)
+        has_errors = any(f'{name}_se' in indices for name in available)
+        estimates = {}
+        masks = {}
+        
+        for name in available:
+            slope, intercept, r2, rmse = ESTIMATION_METHODS[name]
+            values = np.asarray(indices[name], dtype=dtype)
+            mask = np.isfinite(values)
+            estimate = np.where(mask, slope * values + intercept, np.nan)
+            
+            weighted_n += np.where(mask, estimate * r2, 0.0)
+            np.add(weight_sum, r2, out=weight_sum, where=mask)
+            np.add(rmse_sq_sum, rmse**2, out=rmse_sq_sum, where=mask)
+            sample_size += mask
+            if f'{name}_se' in indices:
+                errors = np.asarray(indices[f'{name}_se'], dtype=dtype)
+                sampling_sum += np.where(mask, r2 * abs(slope) * errors, 0.0)
+            estimates[name] = estimate
+            masks[name] = mask
+        
+        valid = sample_size > 0
+        count = sample_size.astype(dtype)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_content = weighted_n / weight_sum
+            rmse_weighted = np.sqrt(rmse_sq_sum / count)
+            r2_mean = weight_sum / count
+            sampling_error = sampling_sum / weight_sum
+        
+        # SAVI adjustment for soil background, Zheng et al. (2018)
+        if 'SAVI' in indices:
+            savi = np.asarray(indices['SAVI'], dtype=dtype)
+            savi_correction = np.where(savi < 0.2, 0.85, np.where(savi > 0.7, 1.12, 1.0)).astype(dtype)
+            n_content = n_content * savi_correction
+            sampling_error = sampling_error * savi_correction
+        
+        # Ensure physiologically possible range for wheat
+        n_content = np.clip(n_content, 1.5, 6.0)
+        
+        results = {
+            'n_content': n_content,
+            'rmse': rmse_weighted,
+            'r2_mean': r2_mean,
+            'sample_size': sample_size,
+            'valid': valid
+        }
+        if has_errors:
+            results['sampling_error'] = sampling_error
+            results['total_error'] = np.sqrt(rmse_weighted**2 + sampling_error**2)
+        for name in available:
+            r2 = ESTIMATION_METHODS[name][2]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weight = r2 / weight_sum
+            results[f'{name}_estimate'] = estimates[name]
+            results[f'{name}_weight'] = np.where(masks[name], weight, np.nan)
+        
+        return results
+    
+    def predict_batch(self, indices):
+        """
+        Predict nitrogen content for a table of vegetation indices
+        
+        Args:
+            indices (pd.DataFrame or dict): Index columns (or arrays) keyed by
+                index name, e.g. from DataLoader.calculate_vegetation_indices_frame.
+                'plot_id' and 'date' columns are carried over to the output.
+            
+        Returns:
+            pd.DataFrame: One row per input row with the ensemble estimate,
+                uncertainty metrics, estimation quality, a 'valid' mask and
+                the estimate, weight, RMSE and R² of every available method
+        """
+        if isinstance(indices, pd.DataFrame):
+            index = indices.index
+        else:
+            index = None
+        arrays = self.estimate_n_content_arrays(indices)
+        
+        df = pd.DataFrame(index=index)
+        for col in ('plot_id', 'date'):
+            if col in indices:
+                df[col] = np.asarray(indices[col])
+        df['n_content'] = arrays['n_content']
+        df['rmse'] = arrays['rmse']
+        df['r2_mean'] = arrays['r2_mean']
+        df['sample_size'] = arrays['sample_size']
+        for col in ('sampling_error', 'total_error'):
+            if col in arrays:
+                df[col] = arrays[col]
+        df['estimation_quality'] = self.get_estimation_quality_batch(arrays['rmse'], arrays['r2_mean'])
+        df['valid'] = arrays['valid']
+        
+        methods = [name for name in ESTIMATION_METHODS if f'{name}_estimate' in arrays]
+        for name in methods:
+            df[f'{name}_weight'] = arrays[f'{name}_weight']
+        for name in methods:
+            _, _, r2, rmse = ESTIMATION_METHODS[name]
+            estimate = arrays[f'{name}_estimate']
+            df[f'{name}_estimate'] = estimate
+            df[f'{name}_rmse'] = np.where(np.isfinite(estimate), rmse, np.nan)
+            df[f'{name}_r2'] = np.where(np.isfinite(estimate), r2, np.nan)
+        
+        return df
+    
+    @staticmethod
+    def batch_to_predictions(batch_df):
+        """
+        Convert valid rows of a predict_batch frame to the list-of-dicts
+        layout returned by predict
+        
+        Args:
+            batch_df (pd.DataFrame): Output of predict_batch
+            
+        Returns:
+            list: List of dictionaries containing predictions and uncertainty metrics
+        """
+        methods = [name for name in ESTIMATION_METHODS if f'{name}_estimate' in batch_df.columns]
+        predictions = []
+        for row in batch_df[batch_df['valid']].to_dict('records'):
+            confidence_intervals = {}
+            method_weights = {}
+            for name in methods:
+                if np.isfinite(row[f'{name}_estimate']):
+                    confidence_intervals[name] = {
+                        'estimate': row[f'{name}_estimate'],
+                        'rmse': row[f'{name}_rmse'],
+                        'r2': row[f'{name}_r2']
+                    }
+                    method_weights[name] = row[f'{name}_weight']
+            
+            uncertainty = {
+                'rmse': row['rmse'],
+                'r2_mean': row['r2_mean'],
+                'sample_size': int(row['sample_size'])
+            }
+            for col in ('sampling_error', 'total_error'):
+                if col in row:
+                    uncertainty[col] = row[col]
+            
+            prediction = {
+                'n_content': row['n_content'],
+                'confidence_intervals': confidence_intervals,
+                'uncertainty': uncertainty,
+                'method_weights': method_weights
+            }
+            for col in ('plot_id', 'date'):
+                if col in row:
+                    prediction[col] = row[col]
+            predictions.append(prediction)
+        
+        return predictions
+    
     def get_estimation_quality(self, uncertainty):
         """
         Evaluate the quality of the estimation based on uncertainty metrics
@@ -153,6 +555,26 @@ class NitrogenEstimator:
         else:
             return "Low Confidence"
     
+    @staticmethod
+    def get_estimation_quality_batch(rmse, r2_mean):
+        """
+        Vectorized get_estimation_quality
+        
+        Args:
+            rmse (np.ndarray): Ensemble RMSE per estimate
+            r2_mean (np.ndarray): Mean R² per estimate
+            
+        Returns:
+            np.ndarray: Quality assessment per estimate
+        """
+        rmse = np.asarray(rmse)
+        r2_mean = np.asarray(r2_mean)
+        return np.select(
+            [(r2_mean > 0.85) & (rmse < 0.35), (r2_mean > 0.75) & (rmse < 0.45)],
+            ["High Confidence", "Moderate Confidence"],
+            default="Low Confidence"
+        ).astype(object)
+    
     def save_model(self, path):
         """Save the model configuration"""
         model_data = {
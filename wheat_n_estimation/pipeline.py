@@ -1,83 +1,303 @@
+import json
+import os
+import re
 from pathlib import Path
 import numpy as np
 import pandas as pd
-from data_loader import DataLoader
-from n_estimator import NitrogenEstimator
+from .checkpoint import CHECKPOINT_CATALOG, CHECKPOINT_DIR, MANIFEST_NAME, RunManifest, scene_inputs
+from .data_loader import DataLoader
+from .n_estimator import NitrogenEstimator
+from .nitrogen_map import NitrogenMapper
+from .sharding import parse_shard
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# Partial outputs of sharded runs, combined by merge_shards
+SHARDS_DIR = 'shards'
+SHARD_FILE = re.compile(r'^shard_(\d+)_of_(\d+)\.csv$')
+
 class NitrogenEstimationPipeline:
-    def __init__(self, data_dir, output_dir):
+    def __init__(self, data_dir, output_dir, checkpoint=False, **loader_options):
         """
         Initialize the pipeline
         
         Args:
-            data_dir (str): Directory containing drone imagery data
+            data_dir (str): Directory containing drone imagery data. Not
+                needed to merge the outputs of sharded runs.
             output_dir (str): Directory for saving outputs
+            checkpoint (bool): Record completed scenes and stages in the
+                output directory, so re-running after an interruption only
+                finishes the missing work. Scene statistics are kept in the
+                loader's catalog, or in checkpoints/scenes.sqlite if no
+                catalog is used; manifest.json lists what was processed.
+            **loader_options: Keyword arguments passed on to DataLoader
+                (e.g. streaming, max_workers, shard)
         """
-        self.data_dir = Path(data_dir)
+        self.data_dir = Path(data_dir) if data_dir is not None else None
         self.output_dir = Path(output_dir)
+        if self.output_dir.exists() and not self.output_dir.is_dir():
+            raise ValueError(f"Output path {self.output_dir} is not a directory")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        self.data_loader = DataLoader(data_dir)
+        if checkpoint and not loader_options.get('catalog'):
+            (self.output_dir / CHECKPOINT_DIR).mkdir(exist_ok=True)
+            loader_options['catalog'] = self.output_dir / CHECKPOINT_DIR / CHECKPOINT_CATALOG
+        self.data_loader = DataLoader(data_dir, **loader_options) if data_dir is not None else None
         self.n_estimator = NitrogenEstimator()
         
+        # Completed scenes and stages of earlier runs with the same settings
+        self.manifest = None
+        if checkpoint and self.data_loader is not None:
+            shard = self.data_loader.shard
+            manifest_name = MANIFEST_NAME if shard is None else \
+                f"manifest_shard_{shard[0]:04d}_of_{shard[1]:04d}.json"
+            self.manifest = RunManifest(self.output_dir / manifest_name, {
+                'data_dir': str(self.data_dir.resolve()),
+                'stats': self.data_loader._stats_mode(),
+                'start_date': self.data_loader.start_date,
+                'end_date': self.data_loader.end_date,
+                'shard': shard
+            })
+        
+        # Results table of the last run, as written to nitrogen_analysis.csv
+        self.results = None
+        
     def run_pipeline(self):
-        """Run the nitrogen content estimation pipeline"""
-        # 1. Load and process time series data
-        print("Loading time series data...")
-        time_series_data = self.data_loader.load_time_series()
+        """
+        Run the nitrogen content estimation pipeline
         
-        # 2. Calculate vegetation indices
-        print("Calculating vegetation indices...")
-        indices = self.data_loader.calculate_vegetation_indices()
+        Scenes are estimated one by one in date order as soon as their band
+        statistics are loaded, and each estimate is appended to
+        nitrogen_analysis.csv right away. The final table, plots and report
+        are written once all scenes are done.
+        
+        With a loader shard, only the scenes of that shard are estimated and
+        written to shards/shard_<i>_of_<N>.csv, with the scene file names
+        and a digest of the scene set the shards were assigned from in
+        shard_<i>_of_<N>.json; merge_shards combines the shards into the
+        final outputs.
+        
+        With checkpointing, scenes processed by an earlier run are taken
+        from the checkpoint without reading the image, and plots and report
+        are only regenerated if the results changed.
+        """
+        # 1.-3. Load scenes, calculate vegetation indices and estimate N content
+        print("Loading scenes and estimating above-ground nitrogen content...")
+        shard = self.data_loader.shard
+        csv_file = self.output_dir / 'nitrogen_analysis.csv'
+        if shard is None:
+            csv_file.unlink(missing_ok=True)
+        records = []
+        scene_results = []
+        scene_names = []
+        for scene in self.data_loader.iter_scenes():
+            record = scene.band_stats
+            indices = self.data_loader.calculate_vegetation_indices_frame(pd.DataFrame([record]))
+            batch_results = self.n_estimator.predict_batch(indices)
+            if not batch_results['valid'].iloc[0]:
+                print(f"Warning: Could not estimate N content for date {scene.date}: "
+                      "No valid indices available for N content estimation")
+            elif shard is None:
+                self._append_results(batch_results, csv_file)
+            if self.manifest is not None:
+                self.manifest.scene_done(scene.path, scene.date, batch_results['valid'].iloc[0])
+            records.append(record)
+            scene_results.append(batch_results)
+            scene_names.append(scene.path.name)
         
-        # 3. Estimate nitrogen content
-        print("Estimating above-ground nitrogen content...")
-        analysis_results = self.n_estimator.predict(indices)
+        self.data_loader.time_series = pd.DataFrame(records)
+        if shard is not None:
+            return self._save_shard(scene_results, scene_names, shard)
+        if not scene_results:
+            raise ValueError(self._no_scenes_message())
+        batch_results = pd.concat(scene_results, ignore_index=True)
         
         # 4. Save results and generate visualizations
-        self._save_results(analysis_results, indices)
+        return self._finish(batch_results)
+    
+    def _finish(self, batch_results):
+        """Save the results table, plots and report of all scenes"""
+        results_df = self._results_frame(batch_results)
+        self._save_results(results_df)
+        self.results = results_df
         
-        return analysis_results
+        return self.n_estimator.batch_to_predictions(batch_results)
     
-    def _save_results(self, analysis_results, indices):
-        """Save analysis results and generate visualizations"""
-        # Create results dataframe
-        results = []
-        for analysis in analysis_results:
-            result = {
-                'date': analysis['date'],
-                'n_content': analysis['n_content'],
-                'rmse': analysis['uncertainty']['rmse'],
-                'r2_mean': analysis['uncertainty']['r2_mean'],
-                'estimation_quality': self.n_estimator.get_estimation_quality(analysis['uncertainty'])
-            }
-            
-            # Add method weights
-            for method, weight in analysis['method_weights'].items():
-                result[f'{method}_weight'] = weight
-            
-            # Add individual estimates and their metrics
-            for method, ci in analysis['confidence_intervals'].items():
-                result[f'{method}_estimate'] = ci['estimate']
-                result[f'{method}_rmse'] = ci['rmse']
-                result[f'{method}_r2'] = ci['r2']
-            
-            results.append(result)
+    def _save_shard(self, scene_results, scene_names, shard):
+        """Write the estimates of one shard, including invalid scenes, and its scene list"""
+        index, count = shard
+        shards_dir = self.output_dir / SHARDS_DIR
+        shards_dir.mkdir(exist_ok=True)
+        
+        # Written under temporary names, so merge never sees a partial file
+        shard_file = shards_dir / f"shard_{index:04d}_of_{count:04d}.csv"
+        scenes_file = shard_file.with_suffix('.json')
+        tmp_file = scenes_file.with_name(f".{scenes_file.name}.{os.getpid()}")
+        with open(tmp_file, 'w') as f:
+            json.dump({'scene_set': self.data_loader.shard_digest, 'scenes': scene_names}, f, indent=2)
+        os.replace(tmp_file, scenes_file)
+        
+        tmp_file = shard_file.with_name(f".{shard_file.name}.{os.getpid()}")
+        batch_results = pd.concat(scene_results, ignore_index=True) if scene_results else None
+        if batch_results is None:
+            tmp_file.write_text('')
+        else:
+            batch_results.to_csv(tmp_file, index=False)
+        os.replace(tmp_file, shard_file)
+        
+        print(f"Shard {index}/{count}: {len(scene_results)} scenes written to {shard_file}")
+        if batch_results is None:
+            return []
+        return self.n_estimator.batch_to_predictions(batch_results)
+    
+    def merge_shards(self):
+        """
+        Combine the outputs of sharded runs into the final outputs
+        
+        Reads the shard tables in the output directory and writes
+        nitrogen_analysis.csv, the plots and the technical report as an
+        unsharded run would, without reading any image. Shards assigned from
+        different scene sets (e.g. an image added while the array tasks
+        started) are rejected, since scenes may be missing or duplicated.
+        
+        Returns:
+            list: Predictions of all scenes in date order
+        """
+        shards_dir = self.output_dir / SHARDS_DIR
+        shard_files = {}
+        for path in sorted(shards_dir.glob('shard_*_of_*.csv')):
+            match = SHARD_FILE.match(path.name)
+            if match:
+                shard_files[int(match.group(1)), int(match.group(2))] = path
+        if not shard_files:
+            raise ValueError(f"No shard outputs found in {shards_dir}")
+        
+        counts = {count for _, count in shard_files}
+        if len(counts) > 1:
+            raise ValueError(f"Shard outputs of different shard counts in {shards_dir}: "
+                             f"{', '.join(str(count) for count in sorted(counts))}")
+        count = counts.pop()
+        missing = sorted(set(range(count)) - {index for index, _ in shard_files})
+        if missing:
+            raise ValueError(f"Missing outputs of shards {', '.join(map(str, missing))} of {count}")
+        
+        scene_lists = {}
+        for (index, _), path in shard_files.items():
+            scenes_file = path.with_suffix('.json')
+            if not scenes_file.exists():
+                raise ValueError(f"Missing scene list of shard {index}: {scenes_file}")
+            with open(scenes_file) as f:
+                scene_lists[index] = json.load(f)
+        if len({scene_list['scene_set'] for scene_list in scene_lists.values()}) > 1:
+            raise ValueError(f"The shard outputs in {shards_dir} were assigned from different "
+                             "scene sets, re-run all shards on an unchanged directory")
+        
+        shard_of = {}
+        for index, scene_list in sorted(scene_lists.items()):
+            for name in scene_list['scenes']:
+                if name in shard_of:
+                    raise ValueError(f"Scene {name} is in the outputs of shards {shard_of[name]} and {index}")
+                shard_of[name] = index
+        
+        tables = []
+        for (index, _), path in shard_files.items():
+            table = None
+            if path.stat().st_size:
+                table = pd.read_csv(path, parse_dates=['date'], float_precision='round_trip')
+                tables.append(table)
+            if (0 if table is None else len(table)) != len(scene_lists[index]['scenes']):
+                raise ValueError(f"Output and scene list of shard {index} do not match, re-run the shard")
+        if not tables:
+            raise ValueError(f"The shard outputs in {shards_dir} contain no scenes")
+        
+        print(f"Merging {count} shards...")
+        batch_results = pd.concat(tables, ignore_index=True)
+        batch_results = batch_results.sort_values('date', kind='stable').reset_index(drop=True)
+        return self._finish(batch_results)
+    
+    @staticmethod
+    def _append_results(batch_results, csv_file):
+        """Append the valid estimates of one scene to the results table"""
+        rows = batch_results[batch_results['valid']].drop(columns=['sample_size', 'valid'])
+        rows.to_csv(csv_file, mode='a', header=not csv_file.exists(), index=False)
+    
+    def write_n_maps(self, dtype='float32'):
+        """
+        Write a per-pixel N content GeoTIFF for every image
         
-        results_df = pd.DataFrame(results)
+        Args:
+            dtype (str): Precision of the per-pixel arithmetic and data type
+                of the maps ('float32' or 'float64')
+            
+        Returns:
+            list: Paths of the maps in the 'n_maps' output subdirectory
+        """
+        print("Writing per-pixel nitrogen maps...")
+        mapper = NitrogenMapper(self.n_estimator, memmap=self.data_loader.memmap, dtype=dtype)
+        image_files = self.data_loader.scene_paths()
+        if not image_files and self.data_loader.shard is None:
+            raise ValueError(self._no_scenes_message())
+        map_dir = self.output_dir / 'n_maps'
+        # Maps of a bounds filter only cover the pixels within the bounds
+        clip = self.data_loader.clip_window
+        if self.manifest is None:
+            return mapper.write_maps(image_files, map_dir, clip)
         
+        # One stage per map, so an interrupted run keeps the finished maps
+        map_files = []
+        skipped = 0
+        for img_file in image_files:
+            stage = f"n_map:{Path(img_file).name}"
+            inputs = {'scene': scene_inputs([img_file]), 'dtype': str(np.dtype(dtype))}
+            if self.manifest.completed(stage, inputs):
+                map_files.extend(self.manifest.outputs(stage))
+                skipped += 1
+                continue
+            written = mapper.write_maps([img_file], map_dir, clip)
+            self.manifest.complete(stage, inputs, written)
+            map_files.extend(written)
+        if skipped:
+            print(f"Skipped {skipped} of {len(image_files)} maps: up to date")
+        return map_files
+    
+    def _no_scenes_message(self):
+        """Error message for filters that match no scene, as raised by the loader"""
+        return f"No images in {self.data_loader.data_dir} match the date and bounds filters"
+    
+    @staticmethod
+    def _results_frame(batch_results):
+        """Select the valid estimates and the columns of the results table"""
+        results_df = batch_results[batch_results['valid']]
+        results_df = results_df.drop(columns=['sample_size', 'valid'])
+        return results_df.dropna(axis=1, how='all').reset_index(drop=True)
+    
+    def _save_results(self, results_df):
+        """Save analysis results and generate visualizations"""
         # Save detailed results
         results_df.to_csv(self.output_dir / 'nitrogen_analysis.csv', index=False)
+        table = results_df.to_csv(index=False)
         
         # Generate visualizations
-        self._plot_time_series_analysis(results_df)
-        self._plot_method_comparison(results_df)
-        self._plot_uncertainty_analysis(results_df)
+        def plot():
+            self._plot_time_series_analysis(results_df)
+            self._plot_method_comparison(results_df)
+            self._plot_uncertainty_analysis(results_df)
+        
+        plots = ['n_content_analysis.png', 'method_comparison.png', 'uncertainty_analysis.png']
+        self._run_stage('plots', table, plots, plot)
         
         # Save technical report
-        self._save_technical_report(results_df)
+        self._run_stage('report', table, ['technical_report.txt'],
+                        lambda: self._save_technical_report(results_df))
+    
+    def _run_stage(self, stage, inputs, outputs, run):
+        """Run an output stage unless a checkpoint shows it is up to date"""
+        if self.manifest is not None and self.manifest.completed(stage, inputs):
+            print(f"Skipping {stage}: up to date")
+            return
+        run()
+        if self.manifest is not None:
+            self.manifest.complete(stage, inputs, [self.output_dir / output for output in outputs])
     
     def _plot_time_series_analysis(self, df):
         """Create time series plots with uncertainty bands"""
@@ -212,23 +432,116 @@ class NitrogenEstimationPipeline:
             f.write("3. Prey & Schmidhalter (2019). Sensors, 19(21), 4640\n")
             f.write("4. Zheng et al. (2018). Remote Sensing, 10(6), 824\n")
 
-def main():
+def add_loader_arguments(parser):
+    """Add the DataLoader options to a command line parser"""
+    parser.add_argument('--streaming', action='store_true',
+                      help='Reduce bands block by block to bound memory use')
+    parser.add_argument('--max_workers', type=int, default=None,
+                      help='Number of threads used to load scenes')
+    parser.add_argument('--catalog', action='store_true',
+                      help='Keep a scene catalog next to the data and only decode new or changed images')
+    parser.add_argument('--overview_level', type=int, default=None,
+                      help='Approximate band means from this overview level for quick checks')
+    parser.add_argument('--sample_pixels', type=int, default=None,
+                      help='Estimate band means from about this many randomly sampled pixels')
+    parser.add_argument('--use_stored_stats', action='store_true',
+                      help='Use band means stored as GDAL statistics instead of reading pixels')
+    parser.add_argument('--write_stats', action='store_true',
+                      help='Write computed band means to .aux.xml sidecars')
+    parser.add_argument('--memmap', action='store_true',
+                      help='Read uncompressed GeoTIFFs through memory maps instead of GDAL')
+    parser.add_argument('--prefetch', type=int, default=0,
+                      help='Number of upcoming scenes read ahead on a background thread')
+    parser.add_argument('--start_date', default=None,
+                      help='Only use scenes acquired on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--end_date', default=None,
+                      help='Only use scenes acquired on or before this date (YYYY-MM-DD)')
+    parser.add_argument('--bounds', type=float, nargs=4, default=None,
+                      metavar=('LEFT', 'BOTTOM', 'RIGHT', 'TOP'),
+                      help='Only use pixels (and scenes) within these bounds')
+    parser.add_argument('--bounds_crs', default=None,
+                      help='CRS of --bounds, e.g. EPSG:4326 (defaults to the image CRS)')
+    parser.add_argument('--checkpoint', action='store_true',
+                      help='Record completed scenes and stages to resume interrupted runs')
+    parser.add_argument('--pixel_maps', action='store_true',
+                      help='Also write per-pixel N content GeoTIFFs')
+    parser.add_argument('--map_precision', choices=['float32', 'float64'], default='float32',
+                      help='Floating point precision of the per-pixel N maps')
+
+def loader_options(args):
+    """DataLoader keyword arguments from parsed command line arguments"""
+    return dict(
+        streaming=args.streaming,
+        max_workers=args.max_workers,
+        catalog=args.catalog,
+        overview_level=args.overview_level,
+        sample_pixels=args.sample_pixels,
+        use_stored_stats=args.use_stored_stats,
+        write_stats=args.write_stats,
+        memmap=args.memmap,
+        prefetch=args.prefetch,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        bounds=args.bounds,
+        bounds_crs=args.bounds_crs
+    )
+
+def main(argv=None):
     """Main function to run the pipeline"""
     import argparse
+    import sys
+    
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['merge']:
+        merge_main(argv[1:])
+        return
     
     parser = argparse.ArgumentParser(
-        description='Estimate above-ground nitrogen content using vegetation indices')
+        description='Estimate above-ground nitrogen content using vegetation indices',
+        epilog='Run "%(prog)s merge --output_dir DIR" to combine the outputs of sharded runs')
     parser.add_argument('--data_dir', required=True,
                       help='Directory containing drone imagery')
     parser.add_argument('--output_dir', required=True,
                       help='Directory for outputs')
+    parser.add_argument('--shard', type=parse_shard, default=None, metavar='INDEX/COUNT',
+                      help='Only process shard INDEX (0-based) of COUNT and write partial outputs, '
+                           'e.g. --shard $SLURM_ARRAY_TASK_ID/16')
+    add_loader_arguments(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
-    pipeline = NitrogenEstimationPipeline(args.data_dir, args.output_dir)
+    pipeline = NitrogenEstimationPipeline(args.data_dir, args.output_dir, checkpoint=args.checkpoint,
+                                          shard=args.shard, **loader_options(args))
     results = pipeline.run_pipeline()
+    if args.pixel_maps:
+        pipeline.write_n_maps(dtype=args.map_precision)
+    
+    if args.shard is not None:
+        print(f"\nShard completed: {len(results)} estimates")
+        return
     
     print("\nAnalysis completed successfully!")
+    _print_latest(pipeline, results)
+
+def merge_main(argv):
+    """Combine the outputs of sharded runs without reading any image"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog='merge', description='Combine the partial outputs of sharded pipeline runs')
+    parser.add_argument('--output_dir', required=True,
+                      help='Output directory shared by the sharded runs')
+    
+    args = parser.parse_args(argv)
+    
+    pipeline = NitrogenEstimationPipeline(None, args.output_dir)
+    results = pipeline.merge_shards()
+    
+    print("\nMerge completed successfully!")
+    _print_latest(pipeline, results)
+
+def _print_latest(pipeline, results):
+    """Print the latest estimate"""
     print("\nLatest Estimation:")
     latest = results[-1]
     print(f"Date: {latest['date']}")
@@ -237,4 +550,4 @@ def main():
     print(f"Average R²: {latest['uncertainty']['r2_mean']:.3f}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,74 @@
+"""Deterministic assignment of work items to the shards of array jobs."""
+
+import hashlib
+import re
+
+SHARD_PATTERN = re.compile(r'^(\d+)/(\d+)$')
+
+def parse_shard(text):
+    """
+    Parse a shard specification
+
+    Args:
+        text (str): 'i/N' with the 0-based shard index i of N shards, e.g.
+            the array task id of a scheduler job
+
+    Returns:
+        tuple: (index, count)
+    """
+    match = SHARD_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError(f"Shard must be given as INDEX/COUNT, got {text!r}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be in [0, {count}), got {index}")
+    return index, count
+
+def stable_hash(key):
+    """Hash of a string that is the same in every process and on every node"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+def assign_shards(sizes, count):
+    """
+    Assign items to shards with balanced total size
+
+    Items are placed largest first on the shard with the smallest total so
+    far (lowest index on ties). Items of equal size are ordered by a stable
+    hash of their key, so the assignment depends only on the keys and sizes,
+    not on listing order, process or node. Every shard must see the same
+    items to agree on the assignment.
+
+    Args:
+        sizes (dict): Item size (e.g. file size in bytes) keyed by a name
+            that is the same for every shard, e.g. the file name
+        count (int): Number of shards
+
+    Returns:
+        dict: Shard index keyed by item name
+    """
+    loads = [0] * count
+    assignment = {}
+    for key in sorted(sizes, key=lambda key: (-sizes[key], stable_hash(key), key)):
+        shard = min(range(count), key=lambda i: (loads[i], i))
+        assignment[key] = shard
+        loads[shard] += sizes[key]
+    return assignment
+
+def scene_set_digest(sizes):
+    """
+    Digest of the items a shard assignment was computed from
+
+    Shards that record different digests saw different directory listings
+    (e.g. a file arriving between task starts) and may have duplicated or
+    dropped items.
+
+    Args:
+        sizes (dict): Item size keyed by name, as passed to assign_shards
+
+    Returns:
+        str: Hex digest of the names and sizes
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for key in sorted(sizes):
+        digest.update(f"{key}\0{sizes[key]}\n".encode())
+    return digest.hexdigest()
@@ -0,0 +1,326 @@
+"""Zonal band statistics for field plots."""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from rasterio import features, windows
+from shapely.geometry import box
+from .data_loader import BANDS, BAND_INDEXES, band_scaling, block_windows
+
+class LabelGridCache:
+    """
+    On-disk cache of plot label grids with least-recently-used eviction.
+
+    Grids are stored as .npy files named by a hash of the polygon set and the
+    grid CRS, transform and shape. They are opened memory-mapped, so reading
+    the labels of one image block only touches the matching rows of the file.
+    """
+
+    def __init__(self, cache_dir, max_entries=16):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir (str): Directory for the cached grids
+            max_entries (int): Number of grids kept before the least recently
+                used ones are evicted
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(plots_hash, crs, transform, shape):
+        """Cache key for a polygon set rasterized onto a grid"""
+        digest = hashlib.sha256(plots_hash.encode())
+        digest.update((crs.to_wkt() if crs else '').encode())
+        digest.update(repr(tuple(transform)).encode())
+        digest.update(repr(tuple(shape)).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"labels_{key}.npy"
+
+    def get(self, key):
+        """
+        Get a cached grid
+
+        Returns:
+            np.ndarray: Read-only memory-mapped grid, or None if not cached
+        """
+        path = self._path(key)
+        try:
+            labels = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return labels
+
+    def put(self, key, labels):
+        """
+        Store a grid and evict the least recently used ones over the limit
+
+        Returns:
+            np.ndarray: Read-only memory-mapped view of the stored grid
+        """
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, labels)
+        os.replace(tmp_path, path)
+        self._evict()
+        return np.load(path, mmap_mode='r')
+
+    def _evict(self):
+        entries = []
+        for path in self.cache_dir.glob('labels_*.npy'):
+            try:
+                entries.append((path.stat().st_mtime_ns, path))
+            except FileNotFoundError:
+                continue
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+def label_dtype(n_plots):
+    """Smallest unsigned integer dtype holding the labels of n_plots plots"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_plots <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"Too many plots for a label grid: {n_plots}")
+
+class ZonalStatistics:
+    """
+    Per-plot band means for trial stations with many plots per flight.
+
+    The plot polygons are rasterized to labels (0 = outside every plot,
+    i = i-th plot) in the smallest integer type that fits the plot count, and
+    the band sums of every plot are accumulated with np.bincount in a single
+    pass over the image blocks. Without a cache, labels are rasterized per
+    block from the plots intersecting it, and the labels of blocks touching
+    a plot are kept in memory per image grid, so later dates on the same
+    grid are not rasterized again while blocks outside every plot cost
+    nothing; with a cache, whole label grids are stored on disk and read
+    memory-mapped. Blocks outside every plot are not read. Where polygons
+    overlap, the pixel belongs to the later plot.
+    """
+
+    def __init__(self, plots, id_column=None, cache_dir=None, max_cached_grids=16):
+        """
+        Initialize the zonal statistics
+
+        Args:
+            plots (gpd.GeoDataFrame or str): Plot polygons or a vector file
+                readable by geopandas
+            id_column (str, optional): Column holding the plot identifiers.
+                Defaults to the GeoDataFrame index.
+            cache_dir (str, optional): Directory for a LabelGridCache, so
+                label grids are reused across runs
+            max_cached_grids (int): LRU limit of the on-disk cache and of the
+                grids (block labels and reprojected plots) held by this object
+        """
+        if not isinstance(plots, gpd.GeoDataFrame):
+            plots = gpd.read_file(plots)
+        if plots.empty:
+            raise ValueError("No plot polygons given")
+
+        self.plots = plots
+        self.plot_ids = list(plots[id_column] if id_column else plots.index)
+        self.label_dtype = label_dtype(len(self.plot_ids))
+        self.max_cached_grids = max_cached_grids
+        # Memory-mapped cached grids and reprojected plots, least recently
+        # used first
+        self._label_grids = OrderedDict()
+        self._block_labels = OrderedDict()
+        self._plot_shapes = OrderedDict()
+        self._lock = threading.RLock()
+        self.cache = LabelGridCache(cache_dir, max_cached_grids) if cache_dir else None
+        self._plots_hash = None
+
+    def plots_hash(self):
+        """Hash of the plot geometries, their CRS and their label order"""
+        if self._plots_hash is None:
+            digest = hashlib.sha256()
+            digest.update((self.plots.crs.to_wkt() if self.plots.crs else '').encode())
+            for wkb in self.plots.geometry.to_wkb():
+                digest.update(len(wkb).to_bytes(8, 'little') if wkb is not None else b'')
+                digest.update(wkb or b'')
+            self._plots_hash = digest.hexdigest()
+        return self._plots_hash
+
+    def label_grid(self, crs, transform, shape):
+        """
+        Rasterize the plots onto an image grid
+
+        Args:
+            crs (rasterio.crs.CRS): Grid CRS
+            transform (affine.Affine): Grid transform
+            shape (tuple): Grid (height, width)
+
+        Returns:
+            np.ndarray: Label grid of the given shape, memory-mapped from the
+                cache if one is used and held in memory otherwise
+        """
+        if self.cache is None:
+            return self._rasterize(crs, transform, shape)
+
+        key = (crs.to_wkt() if crs else None, tuple(transform), tuple(shape))
+        with self._lock:
+            labels = self._label_grids.pop(key, None)
+            if labels is None:
+                labels = self._cached_grid(crs, transform, shape)
+            self._remember(self._label_grids, key, labels)
+        return labels
+
+    def block_labels(self, crs, transform, shape):
+        """
+        Per-block labels of an image grid, filled as blocks are rasterized
+
+        Args:
+            crs (rasterio.crs.CRS): Grid CRS
+            transform (affine.Affine): Grid transform
+            shape (tuple): Grid (height, width)
+
+        Returns:
+            dict: Label array, or None for blocks outside every plot, keyed by
+                block (row_off, col_off, height, width)
+        """
+        key = (crs.to_wkt() if crs else None, tuple(transform), tuple(shape))
+        with self._lock:
+            blocks = self._block_labels.pop(key, None)
+            if blocks is None:
+                blocks = {}
+            self._remember(self._block_labels, key, blocks)
+        return blocks
+
+    def _remember(self, entries, key, value):
+        """Keep a value as most recently used, dropping the oldest over the limit"""
+        entries[key] = value
+        while len(entries) > self.max_cached_grids:
+            entries.popitem(last=False)
+
+    def _cached_grid(self, crs, transform, shape):
+        """Load the grid from the on-disk cache or rasterize and store it"""
+        key = self.cache.key(self.plots_hash(), crs, transform, shape)
+        labels = self.cache.get(key)
+        if labels is None:
+            labels = self.cache.put(key, self._rasterize(crs, transform, shape))
+        return labels
+
+    def _shapes(self, crs):
+        """Non-empty plots in the grid CRS with their labels"""
+        key = crs.to_wkt() if crs else None
+        with self._lock:
+            shapes = self._plot_shapes.pop(key, None)
+            if shapes is None:
+                plots = self.plots
+                if crs is not None and plots.crs is not None:
+                    plots = plots.to_crs(crs)
+                shapes = gpd.GeoDataFrame(
+                    {'label': np.arange(1, len(plots) + 1)}, geometry=plots.geometry.values)
+                shapes = shapes[~(shapes.geometry.isna() | shapes.geometry.is_empty)]
+                # Build the spatial index once, not by the first block query
+                shapes.sindex
+            self._remember(self._plot_shapes, key, shapes)
+        return shapes
+
+    def _rasterize(self, crs, transform, shape, window=None):
+        """
+        Rasterize the plots onto a grid, or onto one window of it
+
+        Only the plots intersecting the window are burned, in label order.
+        """
+        shapes = self._shapes(crs)
+        if window is not None:
+            shapes = shapes.iloc[np.sort(shapes.sindex.query(box(*windows.bounds(window, transform))))]
+            transform = windows.transform(window, transform)
+            shape = (int(window.height), int(window.width))
+        if shapes.empty:
+            return np.zeros(shape, dtype=self.label_dtype)
+
+        return features.rasterize(
+            zip(shapes.geometry, shapes['label']),
+            out_shape=shape,
+            transform=transform,
+            fill=0,
+            dtype=self.label_dtype
+        )
+
+    def plot_means(self, src, window=None):
+        """
+        Compute the band means of every plot in one pass over the image blocks
+
+        Args:
+            src (rasterio.DatasetReader): Open multispectral image
+            window (rasterio.windows.Window, optional): Only use the pixels
+                (and read the blocks) within this window
+
+        Returns:
+            pd.DataFrame: One row per plot with 'plot_id', the band means and
+                'pixel_count' (band means are NaN for plots without pixels)
+        """
+        if self.cache:
+            labels = self.label_grid(src.crs, src.transform, src.shape)
+        else:
+            labels = None
+            blocks = self.block_labels(src.crs, src.transform, src.shape)
+        n_labels = len(self.plot_ids) + 1
+
+        sums = np.zeros((len(BANDS), n_labels), dtype=np.float64)
+        counts = np.zeros(n_labels, dtype=np.int64)
+
+        for block_window in block_windows(src, window):
+            if labels is not None:
+                block_labels = labels[block_window.toslices()]
+            else:
+                key = (int(block_window.row_off), int(block_window.col_off),
+                       int(block_window.height), int(block_window.width))
+                if key in blocks:
+                    block_labels = blocks[key]
+                else:
+                    block_labels = self._rasterize(src.crs, src.transform, src.shape, block_window)
+                    if not block_labels.any():
+                        block_labels = None
+                    blocks[key] = block_labels
+                if block_labels is None:
+                    continue
+            keep = block_labels > 0
+            if not keep.any():
+                continue
+
+            # Skip pixels outside the plots or masked as nodata in any band
+            block = src.read(BAND_INDEXES, window=block_window, masked=True)
+            keep &= ~np.ma.getmaskarray(block).any(axis=0)
+            if not keep.any():
+                continue
+
+            block_labels = block_labels[keep]
+            counts += np.bincount(block_labels, minlength=n_labels)
+            for i in range(len(BANDS)):
+                sums[i] += np.bincount(
+                    block_labels,
+                    weights=block.data[i][keep],
+                    minlength=n_labels
+                )
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums[:, 1:] / counts[1:]
+        scaling = band_scaling(src)
+        if scaling is not None:
+            scales, offsets = scaling
+            means = means * scales[:, None] + offsets[:, None]
+
+        df = pd.DataFrame({'plot_id': self.plot_ids})
+        for band, values in zip(BANDS, means):
+            df[band] = values
+        df['pixel_count'] = counts[1:]
+        return df